@@ -9,8 +9,10 @@
 # UNSW Session 1, 2016
 
 # The agent stores a selection of data in order to function. A representation
-# of the environment is stored as a dictionary where the keys are tuples 
-# representing xy coordinates relative to the starting location, which is (0,0).
+# of the environment is stored as a grid of tiles indexed by xy coordinates
+# relative to the starting location, which is (0,0). The grid is a growable
+# bytearray rather than a dict so lookups don't hash tuples and the map takes
+# a byte per tile.
 # The locations of points of interest (pois), i.e. axes, keys, stones, trees
 # and doors, are stored as sets of tuples, and the location of the gold is
 # stored as a single tuple. What the agent currently possseses are stored as
@@ -18,43 +20,63 @@
 # of the agent is stored via x and y coordinates as well as a compass which
 # represents its current direction. Whether the agent will plan ahead in order
 # to correctly place stones is stored as a boolean. Finally, its current path
-# and sequence of moves to move along it are stored as lists.
+# and sequence of moves to move along it are stored as deques, since both are
+# used up from the front as it goes.
 
-# The view is stored as a dict where keys are coordinates relative to the
-# agent similar to the environment. The agent takes the sent view and uses
+# The view is read from the engine into a fixed 24 byte buffer, and looked
+# up in place like a dict where keys are coordinates relative to the agent
+# similar to the environment (see View). The agent takes the sent view and uses
 # it to update its stored representation of the environment. It then considers
 # a series of targets in priority order: winning (i.e. returning to to the
 # start with the gold), getting the gold, getting tools (by going to the pois)
 # and exploring. It searches for paths for each of these in priority order.
 # Pathfinding uses A* search, with the Manhattan distance as a heuristic,
 # implemented using a priority queue with lower costs being higher priority.
+# Targets that can't be reached at all are ruled out before searching, from
+# the connected regions of the map kept for each inventory (see Regions).
 # If a path is found, it replaces its current path with it. If it reaches
 # its previous target (i.e. no paths to anything of higher priority), it
 # checks whether the previous path is still valid, and if it is continues
 # with that rather than search for a new path. Otherwise, it tries to find a
 # new path, and failing that continues checking the other targets. The tools
-# are sorted by proximity to the agent so it tries to get ones closest to it
-# first. If none of the targets have paths, then the agent tries to explore.
+# and stones are picked up in the order that takes the fewest moves overall,
+# solved as a small travelling salesman problem (see Agent.tour), which once
+# the gold is known leaves out any not worth the detour; only when planning
+# ahead are they tried closest first instead. If none of the targets have
+# paths, then the agent tries to explore.
 # It does this by performing a breadth-first search on the known environment
 # from its current position, looking for points where it can see unmapped
 # areas (and thus map them), including those outside known borders, and goes
-# to the first it finds. If there are no unmapped areas it can can explore,
-# it switches to planning ahead. In this mode, it still performs A* searches
-# to pathfind but when it reaches a junction point e.g. placing a stone or
-# getting tools, it searches again but using the state the world would be in
-# at that time, simulating what would happen if the agent actually did that by
-# pathfinding to the same place but from the "future" location. In this way,
-# it eliminates any possiblities which would not achieve its goal of getting
-# the gold, such as placing stones in bad places, by predicting the future
-# consequences of actions. This is why Agent.pathfind and Agent.valid have
-# so many parameters: so they can be provided a future state. Additionally,
-# the agent is not allowed to place stones until it has fully explored the
-# environment to such an extent that it cannot progress without placing stones,
-# preventing it from making any naive decisions about stone placement which
-# could prevent it from winning later. i.e. it acts naively when it can
-# afford to, in the hopes of winning quicker, but plans ahead when it can't.
-
-import sys, socket, heapq
+# to the first it finds. Those points are kept in a frontier index which is
+# updated as tiles are revealed, so the search never has to look around. If
+# there are no unmapped areas it can can explore, it switches to planning
+# ahead. In this mode, it still performs A* searches to pathfind but when it
+# reaches a junction point e.g. placing a stone or getting tools, it searches
+# again but using the state the world would be in at that time, simulating
+# what would happen if the agent actually did that by pathfinding to the same
+# place but from the "future" location. In this way, it eliminates any
+# possiblities which would not achieve its goal of getting the gold, such as
+# placing stones in bad places, by predicting the future consequences of
+# actions. This is why Agent.pathfind and Agent.valid have so many parameters:
+# so they can be provided a future state. The future states are searched as a
+# whole (Agent.lookahead) with the tiles used up so far kept as a bitmask, so
+# the same future is only ever considered once. Additionally, the agent is not
+# allowed to place stones until it has fully explored the environment to such
+# an extent that it cannot progress without placing stones, preventing it from
+# making any naive decisions about stone placement which could prevent it from
+# winning later. i.e. it acts naively when it can afford to, in the hopes of
+# winning quicker, but plans ahead when it can't.
+
+import sys, os, socket, heapq, time, asyncio, json, struct, mmap, hashlib, threading
+from array import array
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+try:
+    import numpy
+except ImportError:
+    numpy = None # distance fields fall back to breadth-first search
 
 class Compass:
     def __init__(self, start = 'n'):
@@ -70,9 +92,1351 @@ class Compass:
     def curr(self):
         return self.directions[self.i]
 
+class Grid:
+    # Dense store for the environment. Tiles are kept as bytes in a flat
+    # bytearray covering a rectangle of the world, where (x0, y0) is the
+    # position of index 0 and each row runs west to east. Writing outside
+    # the rectangle grows it in chunks, always keeping a margin of at least
+    # one empty cell (byte 0) around every stored tile, so the neighbours of
+    # a stored tile can be indexed directly without bounds checks. It can be
+    # used like the dict it replaces: a position that has never been written
+    # is "not in env", i.e. out of bounds.
+    CHUNK = 16
+    UNKNOWN = bytes([63]) + bytes(range(1, 256)) # translates empty cells to '?', leaving the rest
+
+    def __init__(self):
+        self.x0 = 0
+        self.y0 = 0
+        self.width = 0
+        self.height = 0
+        self.cells = bytearray()
+        self.size = 0 # number of stored tiles
+
+    def index(self, pos):
+        # flat index of pos, or -1 if it lies outside the rectangle
+        x = pos[0] - self.x0
+        y = pos[1] - self.y0
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return x + y * self.width
+        return -1
+
+    def grow(self, x, y):
+        # enlarge the rectangle so (x, y) and its neighbours fit inside
+        chunk = self.CHUNK
+        if self.width:
+            x0 = min(self.x0, x - 1)
+            y0 = min(self.y0, y - 1)
+            x1 = max(self.x0 + self.width, x + 2)
+            y1 = max(self.y0 + self.height, y + 2)
+        else:
+            x0, y0, x1, y1 = x - 1, y - 1, x + 2, y + 2
+        if x0 < self.x0 or not self.width:
+            x0 -= chunk
+        if y0 < self.y0 or not self.width:
+            y0 -= chunk
+        if x1 > self.x0 + self.width or not self.width:
+            x1 += chunk
+        if y1 > self.y0 + self.height or not self.width:
+            y1 += chunk
+        width = x1 - x0
+        cells = bytearray(width * (y1 - y0))
+        # copy old rows across into their new place
+        dx = self.x0 - x0
+        for row in range(self.height):
+            start = row * self.width
+            dest = (row + self.y0 - y0) * width + dx
+            cells[dest:dest + self.width] = self.cells[start:start + self.width]
+        self.x0 = x0
+        self.y0 = y0
+        self.width = width
+        self.height = y1 - y0
+        self.cells = cells
+
+    def fit(self, a, b):
+        # grow so the tiles a and b, and so the rectangle between them, can
+        # be written without growing again, a first
+        for x, y in (a, b):
+            if not (1 <= x - self.x0 < self.width - 1 and 1 <= y - self.y0 < self.height - 1):
+                self.grow(x, y)
+
+    def pad(self, x0, y0, x1, y1):
+        # put '?' in every empty cell from (x0, y0) to (x1, y1) inclusive,
+        # which must already fit, a row or a column at a time (whichever
+        # there are fewer of), returning how many were empty
+        width = self.width
+        cols = x1 - x0 + 1
+        rows = y1 - y0 + 1
+        start = (x0 - self.x0) + (y0 - self.y0) * width
+        if rows <= cols:
+            lines, stride, length, step = rows, width, cols, 1
+        else:
+            lines, stride, length, step = cols, 1, rows, width
+        cells = self.cells
+        count = 0
+        for line in range(lines):
+            i = start + line * stride
+            strip = cells[i:i + length * step:step]
+            empty = strip.count(0)
+            if empty:
+                cells[i:i + length * step:step] = strip.translate(self.UNKNOWN)
+                count += empty
+        self.size += count
+        return count
+
+    def __contains__(self, pos):
+        i = self.index(pos)
+        return i >= 0 and self.cells[i] != 0
+
+    def __getitem__(self, pos):
+        x = pos[0] - self.x0
+        y = pos[1] - self.y0
+        if 0 <= x < self.width and 0 <= y < self.height:
+            t = self.cells[x + y * self.width]
+            if t:
+                return TILES[t]
+        raise KeyError(pos)
+
+    def get(self, pos, default = None):
+        x = pos[0] - self.x0
+        y = pos[1] - self.y0
+        if 0 <= x < self.width and 0 <= y < self.height:
+            t = self.cells[x + y * self.width]
+            if t:
+                return TILES[t]
+        return default
+
+    def __setitem__(self, pos, tile):
+        x, y = pos
+        i = x - self.x0
+        j = y - self.y0
+        if not (1 <= i < self.width - 1 and 1 <= j < self.height - 1):
+            self.grow(x, y)
+            i = x - self.x0
+            j = y - self.y0
+        i += j * self.width
+        if not self.cells[i]:
+            self.size += 1
+        self.cells[i] = ord(tile)
+
+    def __len__(self):
+        return self.size
+
+TILES = [chr(i) for i in range(256)] # byte to tile lookup
+
+def passable(tile, num_stones = 0, optimistic = True, has_axe = False, has_key = False):
+    if not optimistic and tile == '?':
+        return False
+    elif tile == '*':
+        return False
+    elif tile == '.':
+        return False
+    elif tile == 'T' and has_axe == False:
+        return False
+    elif tile == '-' and has_key == False:
+        return False
+    elif tile == '~' and num_stones == 0:
+        return False
+    else:
+        return True
+
+INF = float('inf')
+PROFILE = os.environ.get('AGENT_PROFILE') # 'table' or a file, see Profiler
+MAPS = os.environ.get('AGENT_MAPS') # directory of maps from earlier games, see MapStore
+RECORD = os.environ.get('AGENT_RECORD') # file to record games to, see Recorder
+WINDOW = 25 # tiles in the agent's view, counting its own
+PRUNE_AFTER = 1024 # nodes a lookahead expands before it prunes by crossings
+SPREAD = 6 # frontier tiles this near another agent's claim are left to it
+LANDMARKS = 4 # anchors per state for the searches' estimates, 0 for Manhattan distance alone
+PATHS = 64 # pathfind answers kept, see PathCache
+JUMP_AFTER = 16 # tiles apart start and target are for pathfind to jump (see Agent.jump)
+TOUR = 8 # pickups Agent.tour puts in order at once, the nearest (and tools) first
+SPECIAL = bytes(int(TILES[i] in '~T-oak?') for i in range(256)) # tiles a jump always stops on
+
+def passable_table(num_stones = 0, optimistic = True, has_axe = False, has_key = False):
+    # 256 byte table mapping each tile byte to 1 if passable, for translating
+    # a whole grid's cells at once (empty cells, byte 0, are never passable)
+    return bytes([0] + [int(passable(TILES[i], num_stones, optimistic, has_axe, has_key)) for i in range(1, 256)])
+
+class DistanceField:
+    # Distances in moves from a source tile to every tile of the grid under
+    # one inventory state, i.e. the cost of pathfind to each of them. The
+    # passability of every tile is worked out in one pass by translating the
+    # grid's bytes through a table, then with numpy the distances spread as
+    # a wavefront over the whole array a step at a time, otherwise by a
+    # breadth-first search over flat indices. It is a snapshot: it doesn't
+    # follow later changes to the grid. Given targets, it stops spreading
+    # once the nearest of them has been reached (or every one of them, if
+    # every), so only those as near as it (radius) are certain to have their
+    # distances.
+    def __init__(self, grid, source, table, targets = (), every = False):
+        self.x0 = grid.x0
+        self.y0 = grid.y0
+        self.width = grid.width
+        self.height = grid.height
+        s = grid.index(source)
+        stop = set(i for i in map(grid.index, targets) if i >= 0)
+        if numpy is not None:
+            stop = numpy.array(sorted(stop), dtype = numpy.intp)
+            tiles = numpy.frombuffer(grid.cells, dtype = numpy.uint8).reshape(grid.height, grid.width)
+            mask = numpy.frombuffer(table, dtype = numpy.uint8)[tiles].astype(bool)
+            dist = numpy.full(tiles.shape, -1, dtype = numpy.int32)
+            front = numpy.zeros(tiles.shape, dtype = bool)
+            front.flat[s] = True
+            dist.flat[s] = 0
+            d = 0
+            radius = INF
+            while front.any():
+                d += 1
+                step = numpy.zeros_like(front)
+                step[1:, :] |= front[:-1, :]
+                step[:-1, :] |= front[1:, :]
+                step[:, 1:] |= front[:, :-1]
+                step[:, :-1] |= front[:, 1:]
+                step &= mask
+                step &= dist < 0
+                dist[step] = d
+                front = step
+                if len(stop) and ((dist.flat[stop] >= 0).all() if every else (dist.flat[stop] >= 0).any()):
+                    radius = d
+                    break
+            self.dist = dist.ravel()
+            self.radius = radius
+        else:
+            mask = grid.cells.translate(table)
+            w = grid.width
+            dist = array('i', [-1]) * len(mask)
+            dist[s] = 0
+            queue = deque([s])
+            limit = INF
+            while queue:
+                i = queue.popleft()
+                d = dist[i] + 1
+                if d > limit:
+                    break # everything as near as the nearest target is done
+                # margin around stored tiles keeps these in range
+                for j in (i + w, i + 1, i - w, i - 1):
+                    if mask[j] and dist[j] < 0:
+                        dist[j] = d
+                        queue.append(j)
+                        if j in stop:
+                            stop.discard(j)
+                            if not every or not stop:
+                                limit = d
+            self.dist = dist
+            self.radius = limit
+
+    def get(self, pos):
+        # distance to pos, or None if it can't be reached
+        x = pos[0] - self.x0
+        y = pos[1] - self.y0
+        if 0 <= x < self.width and 0 <= y < self.height:
+            d = self.dist[x + y * self.width]
+            if d >= 0:
+                return int(d)
+        return None
+
+    def path_to(self, pos):
+        # a shortest path from the source to pos, found by stepping back down
+        # the distances, or [] if it can't be reached
+        d = self.get(pos)
+        if d is None:
+            return [] # no path
+        w = self.width
+        dist = self.dist
+        i = pos[0] - self.x0 + (pos[1] - self.y0) * w
+        path = [pos]
+        while d > 0:
+            d -= 1
+            for j in (i + w, i + 1, i - w, i - 1):
+                if dist[j] == d:
+                    i = j
+                    break
+            path.append((self.x0 + i % w, self.y0 + i // w))
+        path.reverse()
+        return path
+
+def crossing_table(optimistic = True, has_axe = False, has_key = False):
+    # like passable_table but 2 for water, which costs a stone to cross
+    return bytes([0] + [2 if TILES[i] == '~' else int(passable(TILES[i], 0, optimistic, has_axe, has_key)) for i in range(1, 256)])
+
+class Crossings:
+    # The fewest water tiles that have to be crossed (i.e. stones placed) to
+    # get from each tile of the grid to a target, by a 0-1 breadth-first
+    # search out from the target: stepping onto water costs one and onto
+    # anything else passable nothing. Stones picked up on the way aren't
+    # taken into account, so it's a lower bound on the stones a way there
+    # needs between those held and those found, which makes it safe for
+    # ruling out plans. Like DistanceField it is a snapshot of the grid.
+    def __init__(self, grid, target, table):
+        self.x0 = grid.x0
+        self.y0 = grid.y0
+        self.width = grid.width
+        self.height = grid.height
+        mask = grid.cells.translate(table)
+        w = grid.width
+        size = len(mask)
+        cost = self.cost = array('i', [size]) * size # size for unreachable
+        t = grid.index(target)
+        if t < 0:
+            return
+        cost[t] = 0
+        queue = deque([t])
+        while queue:
+            i = queue.popleft()
+            # getting to i from a neighbour means stepping onto i
+            step = 1 if mask[i] == 2 else 0
+            c = cost[i] + step
+            for j in (i + w, i + 1, i - w, i - 1):
+                if mask[j] and c < cost[j]:
+                    cost[j] = c
+                    if step:
+                        queue.append(j)
+                    else:
+                        queue.appendleft(j)
+
+    def get(self, pos):
+        # stones needed from pos, or None if the target can't be reached
+        x = pos[0] - self.x0
+        y = pos[1] - self.y0
+        if 0 <= x < self.width and 0 <= y < self.height:
+            c = self.cost[x + y * self.width]
+            if c < len(self.cost):
+                return c
+        return None
+
+class Pois:
+    # The positions of one kind of point of interest, as a set that also
+    # hands them out nearest first by Manhattan distance from anywhere. They
+    # are kept in buckets of SIZE by SIZE tiles, and the buckets are opened
+    # in rings out from the one the search starts in, so only as many are
+    # looked in as it takes to get to the one wanted. A few are quicker just
+    # sorted. Adding and removing is as cheap as for a set, so it's kept up
+    # to date as tiles are seen and used up
+    SIZE = 8
+    FEW = 128 # sorted rather than searched for up to this many
+    heappush = staticmethod(heapq.heappush)
+    heappop = staticmethod(heapq.heappop)
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.bounds = None # buckets spanned, as (min x, min y, max x, max y)
+
+    def add(self, pos):
+        key = (pos[0] // self.SIZE, pos[1] // self.SIZE)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = set()
+            if self.bounds is None:
+                self.bounds = key + key
+            else:
+                x0, y0, x1, y1 = self.bounds
+                self.bounds = (min(x0, key[0]), min(y0, key[1]), max(x1, key[0]), max(y1, key[1]))
+        if pos not in bucket:
+            bucket.add(pos)
+            self.count += 1
+
+    def discard(self, pos):
+        key = (pos[0] // self.SIZE, pos[1] // self.SIZE)
+        bucket = self.buckets.get(key)
+        if bucket and pos in bucket:
+            bucket.remove(pos)
+            self.count -= 1
+            if not bucket:
+                del self.buckets[key] # bounds are left, they only have to cover
+
+    def remove(self, pos):
+        if pos not in self:
+            raise KeyError(pos)
+        self.discard(pos)
+
+    def __contains__(self, pos):
+        return pos in self.buckets.get((pos[0] // self.SIZE, pos[1] // self.SIZE), ())
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for bucket in self.buckets.values():
+            yield from bucket
+
+    def __repr__(self):
+        return repr(set(self))
+
+    def nearest(self, pos, k = None):
+        # (distance, position) pairs from pos, nearest first and then in
+        # order of position, or just the k nearest. Lazy, so it's only as
+        # dear as the pairs taken from it
+        if k is not None:
+            return islice(self.nearest(pos), k)
+        x, y = pos
+        if self.count <= self.FEW:
+            return iter(sorted((abs(p[0] - x) + abs(p[1] - y), p) for p in self))
+        return self.rings(x, y)
+
+    def rings(self, x, y):
+        # handing out positions isn't a search, so it keeps to the real heapq
+        # rather than the profiler's counted one (see Profiler.patch)
+        heappush = Pois.heappush
+        heappop = Pois.heappop
+        size = self.SIZE
+        buckets = self.buckets
+        bx = x // size
+        by = y // size
+        x0, y0, x1, y1 = self.bounds
+        last = max(bx - x0, x1 - bx, by - y0, y1 - by) # ring reaching every bucket
+        queue = []
+        for r in range(last + 1):
+            # nothing in ring r or beyond is nearer than this
+            near = (r - 1) * size + 1 if r else 0
+            while queue and queue[0][0] < near:
+                yield heappop(queue)
+            if r:
+                keys = [(i, by - r) for i in range(bx - r, bx + r + 1)]
+                keys += [(i, by + r) for i in range(bx - r, bx + r + 1)]
+                keys += [(bx - r, j) for j in range(by - r + 1, by + r)]
+                keys += [(bx + r, j) for j in range(by - r + 1, by + r)]
+            else:
+                keys = [(bx, by)]
+            for key in keys:
+                bucket = buckets.get(key)
+                if bucket:
+                    for p in bucket:
+                        heappush(queue, (abs(p[0] - x) + abs(p[1] - y), p))
+        while queue:
+            yield heappop(queue)
+
+class Frontier:
+    # Index of the tiles worth exploring from. For every known tile it counts
+    # the tiles in the 5x5 window around it that are still unknown ('?' or not
+    # in env), keeping only non-zero counts. Standing on a tile shows all of
+    # its window, so these are exactly the tiles from which unmapped areas
+    # can be seen. Revealing a tile only lowers the counts of the known tiles
+    # around it, so the index is kept up to date a tile at a time.
+    def __init__(self, env):
+        self.env = env
+        self.unknown = {} # tile to number of unknown tiles in its window
+
+    def reveal(self, pos):
+        # pos has just become known
+        a, b = pos
+        env = self.env
+        unknown = self.unknown
+        count = 0
+        for x in range(a-2, a+3):
+            for y in range(b-2, b+3):
+                near = (x, y)
+                if near in unknown:
+                    if unknown[near] == 1:
+                        del unknown[near]
+                    else:
+                        unknown[near] -= 1
+                elif env.get(near, '?') == '?':
+                    count += 1
+        if count:
+            unknown[pos] = count
+
+    def hide(self, pos):
+        # pos has become unknown again (see Agent.forget)
+        a, b = pos
+        env = self.env
+        unknown = self.unknown
+        unknown.pop(pos, None)
+        for x in range(a-2, a+3):
+            for y in range(b-2, b+3):
+                near = (x, y)
+                if near != pos and env.get(near, '?') != '?':
+                    unknown[near] = unknown.get(near, 0) + 1
+
+class Regions:
+    # Which passable tiles of env are connected to which, for each inventory
+    # state (i.e. passable_table) that's been asked about, as a union-find
+    # over the grid's cells. Tiles only ever join regions as tiles change,
+    # never leave them, so a region can outgrow what's really connected when
+    # a tile stops being passable (e.g. a '?' turns out to be a wall), but
+    # tiles in different regions are never connected. The sets are built on
+    # first use and again once the grid grows (its cells move) or they're
+    # found to have outgrown the map (see loose).
+    # The world is also split into CLUSTER sized squares, each with a
+    # version counting the changes to its tiles, for telling whether what
+    # was worked out about it still holds (see PathCache). When the borders move out and a
+    # whole rectangle of empty cells becomes '?' (see Agent.cover), the sets
+    # treating '?' as passable are only joined up through it when next used
+    CLUSTER = 16
+
+    def __init__(self, env):
+        self.env = env
+        self.shape = None # grid's rectangle when the sets were built
+        self.sets = {} # table to union-find parents by cell
+        self.versions = {} # cluster to its version, and None to the changes to any of them
+        self.covered = {} # table to the rectangles that became '?' since its sets were last used
+
+    def find(self, parent, i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]] # path halving
+            i = parent[i]
+        return i
+
+    def union(self, parent, i, j):
+        i = self.find(parent, i)
+        j = self.find(parent, j)
+        if i != j:
+            parent[max(i, j)] = min(i, j)
+
+    def parents(self, table):
+        env = self.env
+        shape = (env.x0, env.y0, env.width, env.height)
+        if shape != self.shape:
+            self.shape = shape
+            self.sets.clear()
+            self.covered.clear()
+        parent = self.sets.get(table)
+        covered = self.covered.pop(table, None)
+        if parent is not None and covered:
+            width = env.width
+            cells = env.cells
+            for x0, y0, x1, y1 in covered:
+                for y in range(y0, y1 + 1):
+                    for x in range(x0, x1 + 1):
+                        i = env.index((x, y))
+                        if table[cells[i]]:
+                            for n in (i + width, i + 1, i - width, i - 1):
+                                if table[cells[n]]:
+                                    self.union(parent, i, n)
+        elif parent is None:
+            # every passable tile joined with those east and south of it
+            width = env.width
+            mask = env.cells.translate(table)
+            parent = self.sets[table] = array('i', range(len(mask)))
+            for i, tile in enumerate(mask):
+                if tile:
+                    if mask[i + 1]:
+                        self.union(parent, i, i + 1)
+                    if mask[i + width]:
+                        self.union(parent, i, i + width)
+        return parent
+
+    def region(self, table, pos):
+        # the region pos is in, or None if it isn't passable
+        i = self.env.index(pos)
+        if i < 0 or not table[self.env.cells[i]]:
+            return None
+        return self.find(self.parents(table), i)
+
+    def connected(self, table, a, b):
+        # False if there's certainly no path from a to b, i.e. both are
+        # passable but in different regions, True if they're in the same
+        # region and None if either isn't passable, so it can't tell
+        a = self.region(table, a)
+        b = self.region(table, b)
+        if a is None or b is None:
+            return None
+        return a == b
+
+    def loose(self, table):
+        # a search found regions to be bigger than what's connected now, so
+        # build them again next time
+        self.sets.pop(table, None)
+        self.covered.pop(table, None)
+
+    def touch(self, pos):
+        # something about the tile at pos has changed
+        c = self.CLUSTER
+        cluster = (pos[0] // c, pos[1] // c)
+        versions = self.versions
+        versions[cluster] = versions.get(cluster, 0) + 1
+        versions[None] = versions.get(None, 0) + 1
+
+    def add(self, pos):
+        # the tile at pos has changed
+        self.touch(pos)
+        env = self.env
+        if (env.x0, env.y0, env.width, env.height) != self.shape:
+            self.sets.clear() # cells have moved
+            self.covered.clear()
+        else:
+            i = env.index(pos)
+            cells = env.cells
+            for table, parent in self.sets.items():
+                if table[cells[i]]:
+                    for n in (i + env.width, i + 1, i - env.width, i - 1):
+                        if table[cells[n]]:
+                            self.union(parent, i, n)
+
+    def cover(self, rect):
+        # the empty cells from (x0, y0) to (x1, y1) have all become '?'
+        x0, y0, x1, y1 = rect
+        c = self.CLUSTER
+        versions = self.versions
+        for q in range(y0 // c, y1 // c + 1):
+            for p in range(x0 // c, x1 // c + 1):
+                versions[(p, q)] = versions.get((p, q), 0) + 1
+        versions[None] = versions.get(None, 0) + 1
+        env = self.env
+        if (env.x0, env.y0, env.width, env.height) != self.shape:
+            self.sets.clear() # cells have moved
+            self.covered.clear()
+        else:
+            for table in self.sets:
+                if table[63]: # '?'
+                    self.covered.setdefault(table, []).append(rect)
+
+class PathCache:
+    # pathfind's answers by question, least recently used first, each along
+    # with the versions of the clusters (see Regions) its path goes through
+    # as they were when it was found. An answer holds until one of those
+    # clusters changes; there being no path depends on the whole map, so
+    # that only holds until anything changes. Hits and misses are counted,
+    # here and by the profiler, for tuning its size
+    def __init__(self, regions, capacity = PATHS):
+        self.regions = regions
+        self.capacity = capacity
+        self.entries = {} # question to (path, versions)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        # the answer to key if it still holds, or None
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            path, versions = entry
+            current = self.regions.versions
+            if all(current.get(cluster, 0) == version for cluster, version in versions):
+                self.entries[key] = entry # now the most recently used
+                self.hits += 1
+                Profiler.count('hits')
+                return list(path)
+        self.misses += 1
+        Profiler.count('misses')
+        return None
+
+    def put(self, key, path):
+        current = self.regions.versions
+        if path:
+            c = Regions.CLUSTER
+            clusters = set((x // c, y // c) for x, y in path)
+        else:
+            clusters = [None]
+        if len(self.entries) >= self.capacity:
+            del self.entries[next(iter(self.entries))]
+            self.evictions += 1
+        self.entries[key] = (tuple(path), [(cluster, current.get(cluster, 0)) for cluster in clusters])
+
+    def __repr__(self):
+        return 'PathCache(%d/%d, %d hits, %d misses, %d evictions)' % (len(self.entries), self.capacity,
+            self.hits, self.misses, self.evictions)
+
+class Landmarks:
+    # Distances from a few anchor tiles to every tile of env, for each
+    # inventory state (i.e. passable_table) that's been asked about, for the
+    # ALT estimate of the moves between two tiles: by the triangle inequality
+    # no path from u to v is shorter than |d(L, u) - d(L, v)| for any anchor
+    # L. The anchors are home (0,0), the gold once it's been seen and then
+    # the frontier tiles farthest from the anchors picked so far, out at the
+    # edges of the map where the estimate is best.
+    # The distances start out exact and are kept up to date as tiles become
+    # passable, by spreading the shorter distances through them, with the
+    # tiles changed saved up for each state until it's next searched. Tiles
+    # that stop being passable are left as they were, which can only make
+    # the estimate lower, never too high. Neighbouring passable tiles never
+    # differ by more than one, so the estimate is consistent, and a tile that
+    # can't be reached from an anchor (-1) can't reach the tiles that can.
+    # The anchors are picked again once env has doubled in size. Each state
+    # has a version, changed whenever its distances are, for searches that
+    # keep estimates between ticks (see DStarLite); the cells can move when
+    # the grid grows without the distances changing, so such a search has to
+    # ask for its pairs again every time it resumes
+    def __init__(self, env, frontier):
+        self.env = env
+        self.frontier = frontier
+        self.pinned = [(0,0)] # always anchors while they're passable
+        self.shape = None # grid's rectangle the distances are laid out for
+        self.sets = {} # table to distances by cell, one array per anchor
+        self.built = {} # table to the size of env when its anchors were picked
+        self.versions = {} # table to its version
+        self.pending = {} # table to the tiles changed since its distances were brought up to date
+        self.covered = {} # table to the rectangles that became '?' since then (see Agent.cover)
+
+    def pin(self, pos):
+        # make pos an anchor from now on
+        if pos not in self.pinned:
+            self.pinned.append(pos)
+            for table in self.sets:
+                self.versions[table] += 1
+            self.sets.clear()
+            self.pending.clear()
+            self.covered.clear()
+
+    def follow(self, table):
+        # bring the distances for table up to date: move them to where the
+        # cells are once the grid has grown, and spread them through the
+        # tiles changed since
+        env = self.env
+        shape = (env.x0, env.y0, env.width, env.height)
+        if shape != self.shape and self.shape is not None:
+            x0, y0, width, height = self.shape
+            dx = x0 - env.x0
+            for dists in self.sets.values():
+                for k, dist in enumerate(dists):
+                    moved = array('i', [-1]) * len(env.cells)
+                    for row in range(height):
+                        start = row * width
+                        dest = (row + y0 - env.y0) * env.width + dx
+                        moved[dest:dest + width] = dist[start:start + width]
+                    dists[k] = moved
+        self.shape = shape
+        dists = self.sets.get(table)
+        pending = self.pending.pop(table, None)
+        covered = self.covered.pop(table, None)
+        if dists and (pending or covered):
+            changed = False
+            for pos in pending or ():
+                changed |= self.lower(table, dists, pos)
+            for x0, y0, x1, y1 in covered or ():
+                for y in range(y0, y1 + 1):
+                    for x in range(x0, x1 + 1):
+                        changed |= self.lower(table, dists, (x, y))
+            if changed:
+                self.versions[table] += 1
+
+    def build(self, table):
+        # the distances from each anchor for table, the anchors being picked
+        # afresh
+        env = self.env
+        cells = env.cells
+        dists = []
+        for pos in self.pinned:
+            i = env.index(pos)
+            if i >= 0 and table[cells[i]] and len(dists) < LANDMARKS:
+                dists.append(self.spread(pos, table))
+        far = [i for i in map(env.index, self.frontier.unknown) if i >= 0 and table[cells[i]]]
+        while dists and far and len(dists) < LANDMARKS:
+            # as far from the nearest anchor as can be, and not cut off from any
+            best = max(far, key = lambda i: min(dist[i] for dist in dists))
+            if min(dist[best] for dist in dists) <= 0:
+                break
+            dists.append(self.spread((env.x0 + best % env.width, env.y0 + best // env.width), table))
+        return dists
+
+    def spread(self, pos, table):
+        dist = DistanceField(self.env, pos, table).dist
+        if not isinstance(dist, array):
+            dist = array('i', dist.tobytes()) # from numpy, for changing a cell at a time
+        return dist
+
+    def toward(self, table, pos):
+        # (distances, distance to pos) for each anchor pos can be reached
+        # from under table, for bound, building the distances if need be
+        if not LANDMARKS:
+            return []
+        self.follow(table)
+        env = self.env
+        i = env.index(pos)
+        if i < 0 or not table[env.cells[i]]:
+            return []
+        dists = self.sets.get(table)
+        if dists is None or len(env) > 2 * self.built[table]:
+            dists = self.sets[table] = self.build(table)
+            self.built[table] = len(env)
+            self.versions[table] = self.versions.get(table, 0) + 1
+            self.pending.pop(table, None)
+            self.covered.pop(table, None)
+        return [(dist, dist[i]) for dist in dists if dist[i] >= 0]
+
+    def version(self, table):
+        self.follow(table)
+        return self.versions.get(table, 0)
+
+    @staticmethod
+    def bound(pairs, i, h):
+        # the highest of h (e.g. the Manhattan distance) and what the anchors
+        # say about the moves between the passable cell i and the tile pairs
+        # are toward
+        for dist, d in pairs:
+            e = dist[i]
+            if e >= 0:
+                e = e - d if e > d else d - e
+                if e > h:
+                    h = e
+        return h
+
+    def add(self, pos):
+        # the tile at pos has changed
+        for table in self.sets:
+            pending = self.pending.get(table)
+            if pending is None:
+                pending = self.pending[table] = set()
+            pending.add(pos)
+
+    def cover(self, rect):
+        # the empty cells in the rectangle have all become '?', which only
+        # matters to the states treating '?' as passable
+        for table in self.sets:
+            if table[63]: # '?'
+                self.covered.setdefault(table, []).append(rect)
+
+    def lower(self, table, dists, pos):
+        # if the tile at pos has become passable the distances through it may
+        # be shorter, and its neighbours may be reached through it. Returns
+        # whether any distance changed
+        env = self.env
+        cells = env.cells
+        w = env.width
+        i = env.index(pos)
+        changed = False
+        if table[cells[i]]:
+            for dist in dists:
+                d = dist[i]
+                for n in (i + w, i + 1, i - w, i - 1):
+                    e = dist[n]
+                    if e >= 0 and (d < 0 or e + 1 < d) and table[cells[n]]:
+                        d = e + 1
+                if d < 0:
+                    continue # can't be reached
+                if d != dist[i]:
+                    dist[i] = d
+                    changed = True
+                queue = None # only made if it gets any further
+                j = i
+                while True:
+                    d = dist[j] + 1
+                    for n in (j + w, j + 1, j - w, j - 1):
+                        e = dist[n]
+                        if (e < 0 or d < e) and table[cells[n]]:
+                            dist[n] = d
+                            changed = True
+                            if queue is None:
+                                queue = deque()
+                            queue.append(n)
+                    if not queue:
+                        break
+                    j = queue.popleft()
+        return changed
+
+class DStarLite:
+    # Incremental planner (D* Lite) for repeated queries to one target under
+    # one inventory state. The search runs backwards from the target, so what
+    # it has learnt stays correct as the agent moves, and when tiles change
+    # only the cells next to them are updated and the search repairs from
+    # there rather than starting over. Costs are the same as Agent.pathfind.
+    # The estimate from the start is the agent's Landmarks bound, and as the
+    # anchors' distances change under it every key in the queue is worked out
+    # again, so they are never too high.
+    def __init__(self, agent, target, num_stones, optimistic, has_axe, has_key):
+        self.agent = agent
+        self.target = target
+        self.num_stones = num_stones
+        self.optimistic = optimistic
+        self.has_axe = has_axe
+        self.has_key = has_key
+        self.g = {}
+        self.rhs = {target: 0}
+        self.queue = [] # heap of (key, pos), stale entries are skipped
+        self.open = {} # pos to its current key in queue
+        self.km = 0 # heuristic offset accumulated as the start moves
+        self.start = None
+        self.changed = set() # tiles changed since the last plan
+        self.covered = [] # rectangles that became '?' since the last plan, see Agent.cover
+        self.table = agent.table(num_stones, optimistic, has_axe, has_key)
+        self.pairs = [] # toward the start, see Landmarks
+        self.version = None # of the landmarks when they were made
+
+    def passable(self, pos):
+        return self.agent.valid(pos, self.num_stones, self.optimistic, None, self.has_axe, self.has_key)
+
+    def estimate(self, pos):
+        # moves from the start to pos at the least
+        h = abs(pos[0] - self.start[0]) + abs(pos[1] - self.start[1])
+        if self.pairs:
+            env = self.agent.env
+            i = env.index(pos)
+            if i >= 0 and self.table[env.cells[i]]:
+                h = Landmarks.bound(self.pairs, i, h)
+        return h
+
+    def key(self, pos):
+        m = min(self.g.get(pos, INF), self.rhs.get(pos, INF))
+        return (m + self.estimate(pos) + self.km, m)
+
+    def update_vertex(self, pos):
+        if pos != self.target:
+            best = INF
+            if self.passable(pos):
+                a, b = pos
+                for exp in [(a,b+1), (a+1,b), (a,b-1), (a-1,b)]:
+                    cost = self.g.get(exp, INF) + 1
+                    if cost < best and self.passable(exp):
+                        best = cost
+            if best < INF:
+                self.rhs[pos] = best
+            else:
+                self.rhs.pop(pos, None)
+        if self.g.get(pos, INF) != self.rhs.get(pos, INF):
+            k = self.key(pos)
+            self.open[pos] = k
+            heapq.heappush(self.queue, (k, pos))
+        else:
+            self.open.pop(pos, None)
+
+    def compute(self):
+        g = self.g
+        rhs = self.rhs
+        queue = self.queue
+        start = self.start
+        while queue:
+            k, pos = queue[0]
+            if self.open.get(pos) != k:
+                heapq.heappop(queue) # stale entry
+                continue
+            if k >= self.key(start) and rhs.get(start, INF) == g.get(start, INF):
+                break
+            heapq.heappop(queue)
+            new = self.key(pos)
+            if k < new:
+                self.open[pos] = new
+                heapq.heappush(queue, (new, pos))
+                continue
+            del self.open[pos]
+            a, b = pos
+            expansions = [(a,b+1), (a+1,b), (a,b-1), (a-1,b)]
+            if g.get(pos, INF) > rhs.get(pos, INF):
+                # overconsistent so settle it and relax its neighbours
+                cost = rhs[pos]
+                g[pos] = cost
+                if pos == self.target or self.passable(pos):
+                    for exp in expansions:
+                        if exp != self.target and cost + 1 < rhs.get(exp, INF) and self.passable(exp):
+                            rhs[exp] = cost + 1
+                            k = self.key(exp)
+                            self.open[exp] = k
+                            heapq.heappush(queue, (k, exp))
+            else:
+                # underconsistent so reset it and everything that relied on it
+                g.pop(pos, None)
+                self.update_vertex(pos)
+                for exp in expansions:
+                    self.update_vertex(exp)
+
+    def plan(self, start):
+        landmarks = self.agent.landmarks
+        if self.start is None:
+            self.start = start
+            self.pairs = landmarks.toward(self.table, start)
+            self.version = landmarks.version(self.table)
+            self.update_vertex(self.target)
+        else:
+            if start != self.start:
+                self.pairs = landmarks.toward(self.table, self.start) # the cells may have moved
+                self.km += self.estimate(start)
+                self.start = start
+            self.pairs = landmarks.toward(self.table, start)
+            version = landmarks.version(self.table)
+            if version != self.version:
+                # the estimates have changed, so key the queue afresh
+                self.version = version
+                self.km = 0
+                self.open = {pos: self.key(pos) for pos in self.open}
+                self.queue = [(k, pos) for pos, k in self.open.items()]
+                heapq.heapify(self.queue)
+        for x0, y0, x1, y1 in self.covered:
+            self.changed.update((x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1))
+        self.covered = []
+        for pos in self.changed:
+            a, b = pos
+            for exp in [pos, (a,b+1), (a+1,b), (a,b-1), (a-1,b)]:
+                self.update_vertex(exp)
+        self.changed = set()
+        self.compute()
+
+        # walk down the cost-to-target values to get the path
+        g = self.g
+        if g.get(start, INF) == INF and start != self.target:
+            return [] # no path
+        pos = start
+        path = [start]
+        while pos != self.target:
+            a, b = pos
+            best = None
+            cost = INF
+            for exp in [(a,b+1), (a+1,b), (a,b-1), (a-1,b)]:
+                if g.get(exp, INF) < cost and self.passable(exp):
+                    best = exp
+                    cost = g[exp]
+            if best is None or len(path) > len(g):
+                return [] # shouldn't happen once compute has finished
+            pos = best
+            path.append(pos)
+        return path
+
+class MapStore:
+    # Maps from earlier games, kept in a directory with a file per map named
+    # after a fingerprint of the view the agent spawned with. As the agent's
+    # coordinates are relative to where it started and the way it faced, a
+    # game on the same world from the same start sees the same first view and
+    # lines up with the stored map exactly.
+    # A file is a header followed by a Grid's cells as they are, so loading
+    # is just memory-mapping it and using the cells in place (read-only).
+    HEADER = struct.Struct('<4sBxxxiiiii') # magic, version, x0, y0, width, height, size
+    MAGIC = b'AMAP'
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok = True)
+
+    def key(self, view):
+        frame = ''.join(view[pos] for pos in VIEW).encode('latin-1')
+        return hashlib.blake2b(frame, digest_size = 8).hexdigest()
+
+    def file(self, key):
+        return os.path.join(self.path, key + '.map')
+
+    def load(self, key):
+        # the stored Grid for key, or None if there isn't a usable one
+        try:
+            with open(self.file(key), 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None # not stored (or empty)
+        if len(data) < self.HEADER.size:
+            return None
+        magic, version, x0, y0, width, height, size = self.HEADER.unpack_from(data)
+        if magic != self.MAGIC or version != self.VERSION or len(data) != self.HEADER.size + width * height:
+            return None
+        grid = Grid.__new__(Grid)
+        grid.x0 = x0
+        grid.y0 = y0
+        grid.width = width
+        grid.height = height
+        grid.cells = memoryview(data)[self.HEADER.size:]
+        grid.size = size
+        return grid
+
+    def save(self, key, grid):
+        # written to a temporary file first so a map is never half there
+        path = self.file(key)
+        temp = '%s.%d.tmp' % (path, os.getpid())
+        with open(temp, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, grid.x0, grid.y0, grid.width, grid.height, grid.size))
+            f.write(grid.cells)
+        os.replace(temp, path)
+
+class SharedMap:
+    # One map for several agents in the same world, such as copies of the
+    # agent exploring it together in sim.py. The views alone don't say where
+    # the agents are relative to each other, so each one joins with where
+    # it starts in world coordinates and the way it faces (see Agent.join),
+    # and the map is kept in world coordinates.
+    # It is a log of changes in a block of shared memory: each agent appends
+    # the tiles it has seen change and reads the others' since it last
+    # looked, so merging costs an agent only what's new to it. Alongside the
+    # log each agent has a slot saying what it's heading for, which the
+    # others keep clear of so that they spread out over the unexplored parts
+    # and don't go for the same things, what it's stepping onto this turn if
+    # that changes it (so two agents moving at once never both pick up the
+    # same thing or put a stone in the same water), whether it's waiting
+    # for the others and the tools and stones it holds. News is anything
+    # that can give a waiting agent something to do: records appended,
+    # things given up by the agent heading for them and changes in what an
+    # agent reports holding. Another process can attach to the block by
+    # name, and given the same lock agents share it the same way from
+    # threads or processes. Once the log is full nothing more is shared.
+    HEADER = struct.Struct('<iii') # records, agents, news
+    SLOT = struct.Struct('<iiiiiBBBx') # claimed x, y, step x, y, news read when it began waiting, has axe, has key, stones
+    RECORD = struct.Struct('<hhBB') # x, y, tile, agent
+    AGENTS = 16
+    NOWHERE = -1 << 31 # no claim
+    BUSY = -1 # not waiting
+    DONE = (1 << 31) - 1 # out of the game, so waiting for good
+
+    def __init__(self, capacity = 1 << 18, name = None, lock = None):
+        self.lock = lock or threading.Lock()
+        self.slots = self.HEADER.size
+        self.records = self.slots + self.AGENTS * self.SLOT.size
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create = True, size = self.records + capacity * self.RECORD.size)
+            self.HEADER.pack_into(self.memory.buf, 0, 0, 0, 0)
+            for agent in range(self.AGENTS):
+                self.SLOT.pack_into(self.memory.buf, self.slots + agent * self.SLOT.size, self.NOWHERE, self.NOWHERE, self.NOWHERE, self.NOWHERE, self.BUSY, 0, 0, 0)
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+        self.name = self.memory.name
+        self.capacity = (self.memory.size - self.records) // self.RECORD.size
+
+    def join(self):
+        # a number for a new agent
+        with self.lock:
+            count, agents, news = self.HEADER.unpack_from(self.memory.buf, 0)
+            if agents == self.AGENTS:
+                raise ValueError('no room for another agent')
+            self.HEADER.pack_into(self.memory.buf, 0, count, agents + 1, news)
+        return agents
+
+    def publish(self, agent, tiles):
+        # append (x, y, tile) changes seen by agent
+        with self.lock:
+            count, agents, news = self.HEADER.unpack_from(self.memory.buf, 0)
+            tiles = tiles[:self.capacity - count]
+            i = self.records + count * self.RECORD.size
+            for x, y, tile in tiles:
+                self.RECORD.pack_into(self.memory.buf, i, x, y, ord(tile), agent)
+                i += self.RECORD.size
+            self.HEADER.pack_into(self.memory.buf, 0, count + len(tiles), agents, news + len(tiles))
+
+    def read(self, agent, start):
+        # the (x, y, tile) changes seen by the other agents from record start
+        # on, where to start next time and the news so far. Records are never
+        # changed once written, so only the header needs the lock
+        with self.lock:
+            count, agents, news = self.HEADER.unpack_from(self.memory.buf, 0)
+        tiles = []
+        for x, y, tile, by in self.RECORD.iter_unpack(self.memory.buf[self.records + start * self.RECORD.size:self.records + count * self.RECORD.size]):
+            if by != agent:
+                tiles.append((x, y, TILES[tile]))
+        return tiles, count, news
+
+    def claim(self, agent, pos, step = False):
+        # agent is heading for pos, a frontier tile or something to pick up,
+        # or if step is stepping onto it this turn (None for nowhere), unless
+        # another agent already is: returns whether it got it. Checking and
+        # taking happen under the one lock, so no two agents ever hold the
+        # same claim. Giving up what it was heading for is news, as it's then
+        # free for the others
+        x, y = pos or (self.NOWHERE, self.NOWHERE)
+        at = 2 if step else 0
+        with self.lock:
+            slots = list(self.SLOT.iter_unpack(self.memory.buf[self.slots:self.records]))
+            if pos and any(other != agent and slot[at:at + 2] == (x, y) for other, slot in enumerate(slots)):
+                return False
+            slot = list(slots[agent])
+            if not step and slot[0] != self.NOWHERE and slot[:2] != [x, y]:
+                count, agents, news = self.HEADER.unpack_from(self.memory.buf, 0)
+                self.HEADER.pack_into(self.memory.buf, 0, count, agents, news + 1)
+            slot[at:at + 2] = x, y
+            self.SLOT.pack_into(self.memory.buf, self.slots + agent * self.SLOT.size, *slot)
+        return True
+
+    def claimed(self, agent):
+        # what the other agents are heading for
+        with self.lock:
+            slots = list(self.SLOT.iter_unpack(self.memory.buf[self.slots:self.records]))
+        return [slot[:2] for other, slot in enumerate(slots) if other != agent and slot[0] != self.NOWHERE]
+
+    def report(self, agent, since, has_axe, has_key, num_stones):
+        # agent has had nothing to do since it read the news up to since
+        # (BUSY if it has, DONE once it's out of the game) and holds these
+        holds = (int(has_axe), int(has_key), min(num_stones, 255))
+        with self.lock:
+            slot = self.SLOT.unpack_from(self.memory.buf, self.slots + agent * self.SLOT.size)
+            if slot[5:] != holds:
+                count, agents, news = self.HEADER.unpack_from(self.memory.buf, 0)
+                self.HEADER.pack_into(self.memory.buf, 0, count, agents, news + 1)
+            self.SLOT.pack_into(self.memory.buf, self.slots + agent * self.SLOT.size, *slot[:4], since, *holds)
+
+    def tools(self, agent):
+        # whether any other agent still in the game has the axe, and the
+        # key, and how many stones they have between them
+        with self.lock:
+            count, agents, news = self.HEADER.unpack_from(self.memory.buf, 0)
+            slots = list(self.SLOT.iter_unpack(self.memory.buf[self.slots:self.records]))[:agents]
+        others = [slot for other, slot in enumerate(slots) if other != agent and slot[4] != self.DONE]
+        return any(slot[5] for slot in others), any(slot[6] for slot in others), sum(slot[7] for slot in others)
+
+    def stalled(self):
+        # every agent is waiting and there's been no news since any of them
+        # began to, so none of them will ever have anything to do
+        with self.lock:
+            count, agents, news = self.HEADER.unpack_from(self.memory.buf, 0)
+            slots = list(self.SLOT.iter_unpack(self.memory.buf[self.slots:self.records]))[:agents]
+        return all(slot[4] >= news for slot in slots)
+
+    def close(self):
+        self.memory.close()
+
+    def unlink(self):
+        # by whoever made it, once every agent is done with it
+        self.memory.unlink()
+
+class Profiler:
+    # opt-in instrumentation of an agent's decisions, switched on by setting
+    # AGENT_PROFILE (or -P) to 'table' for a summary table on stderr at the
+    # end of the game, or to a file to append a JSON line per tick to. It
+    # wraps the agent's methods in timing and counting versions when
+    # installed, putting them back once closed. The heap and queue are the
+    # module's, shared with the fields and searches every agent uses, so
+    # while any profiler is installed every agent in the process, profiled
+    # or not, goes through counting versions of them, though the counts only
+    # go to the profiler of the agent deciding in the thread counting them.
+    # They are put back when the last profiler is closed, installing and
+    # closing under a lock since agents may be playing in several threads.
+    # Phase times include the phases called from them, and nodes are every
+    # entry taken off a search's heap or queue, stale ones included, with
+    # expanded counting just those off a heap, i.e. by the A* searches. Hits
+    # and misses are of the agent's PathCache
+    PHASES = ['update', 'ingest', 'get_action', 'check_gold', 'check_pois', 'tour', 'explore', 'repair',
+        'pathfind', 'search', 'jump', 'lookahead', 'steer', 'reach', 'field', 'path_valid', 'safe_moves']
+    COUNTERS = ['nodes', 'expanded', 'pushes', 'valid', 'revalidations', 'replans', 'hits', 'misses']
+    local = threading.local() # active: profiler of the agent deciding in this thread
+    installed = 0 # profilers installed, for putting the heap and queue back
+    lock = threading.Lock() # guards installed and the patching
+
+    def __init__(self, out = 'table'):
+        self.out = None if out == 'table' else open(out, 'a')
+        self.ticks = 0
+        self.running = set() # phases being timed, so recursion isn't counted twice
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+        self.phases = {}
+        self.total_counts = dict.fromkeys(self.COUNTERS, 0)
+        self.total_phases = {}
+        self.agent = None # installed in
+
+    def install(self, agent):
+        Profiler.patch()
+        self.agent = agent
+        agent.profiler = self
+        agent.valid = self.counted('valid', agent.valid)
+        agent.set_path = self.counted('replans', agent.set_path)
+        agent.walk_path = self.counted('revalidations', agent.walk_path)
+        for name in self.PHASES:
+            setattr(agent, name, self.timed(name, getattr(agent, name)))
+        agent.get_action = self.ticked(agent.get_action)
+
+    def uninstall(self):
+        # put the agent's own methods back
+        agent = self.agent
+        if agent is None:
+            return
+        for name in ['valid', 'set_path', 'walk_path', 'get_action'] + self.PHASES:
+            agent.__dict__.pop(name, None)
+        agent.profiler = None
+        self.agent = None
+        Profiler.unpatch()
+
+    @staticmethod
+    def patch():
+        # route the module's heap and queue through counters while any
+        # profiler is installed
+        global heapq, deque
+        with Profiler.lock:
+            Profiler.installed += 1
+            if not isinstance(heapq, Counted):
+                heapq = Counted(heapq)
+                deque = counted_deque(deque)
+
+    @staticmethod
+    def unpatch():
+        global heapq, deque
+        with Profiler.lock:
+            Profiler.installed -= 1
+            if not Profiler.installed and isinstance(heapq, Counted):
+                heapq = heapq.module
+                deque = deque.original
+
+    @staticmethod
+    def count(name):
+        active = getattr(Profiler.local, 'active', None)
+        if active:
+            active.counts[name] += 1
+
+    def counted(self, name, method):
+        counts = self.counts
+        def wrapper(*args, **kwargs):
+            counts[name] += 1
+            return method(*args, **kwargs)
+        return wrapper
+
+    def timed(self, name, method):
+        def wrapper(*args, **kwargs):
+            if name in self.running:
+                return method(*args, **kwargs) # already timed further out
+            local = Profiler.local
+            outer = getattr(local, 'active', None)
+            local.active = self
+            self.running.add(name)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                phase = self.phases.setdefault(name, [0, 0.0])
+                phase[0] += 1
+                phase[1] += time.perf_counter() - start
+                self.running.discard(name)
+                local.active = outer
+        return wrapper
+
+    def ticked(self, method):
+        # a tick ends when the agent has decided on an action
+        def wrapper(*args, **kwargs):
+            action = method(*args, **kwargs)
+            if not self.running:
+                self.end_tick()
+            return action
+        return wrapper
+
+    def end_tick(self):
+        self.ticks += 1
+        if self.out:
+            self.out.write(json.dumps({'tick': self.ticks, 'counters': self.counts, 'phases': self.phases}) + '\n')
+        for name, count in self.counts.items():
+            self.total_counts[name] += count
+            self.counts[name] = 0
+        for name, (calls, spent) in self.phases.items():
+            phase = self.total_phases.setdefault(name, [0, 0.0])
+            phase[0] += calls
+            phase[1] += spent
+        self.phases.clear()
+
+    def close(self):
+        # at the end of the game
+        self.uninstall()
+        if self.out:
+            self.out.write(json.dumps({'ticks': self.ticks, 'counters': self.total_counts, 'phases': self.total_phases}) + '\n')
+            self.out.close()
+            self.out = None
+            return
+        ticks = max(self.ticks, 1)
+        spent = sum(self.total_phases.get(name, [0, 0.0])[1] for name in ['update', 'get_action']) or 1
+        out = sys.stderr
+        out.write('%-12s %9s %10s %8s %12s\n' % ('phase', 'calls', 'time(s)', 'share', 'per tick(ms)'))
+        for name in self.PHASES:
+            calls, total = self.total_phases.get(name, [0, 0.0])
+            out.write('%-12s %9d %10.3f %7.1f%% %12.3f\n' % (name, calls, total, 100 * total / spent, 1000 * total / ticks))
+        out.write('%-12s %9s %10s\n' % ('counter', 'total', 'per tick'))
+        for name in self.COUNTERS:
+            out.write('%-12s %9d %10.1f\n' % (name, self.total_counts[name], self.total_counts[name] / ticks))
+        out.write('%d ticks\n' % self.ticks)
+
+class Counted:
+    # heapq, counting pushes and pops for the active profiler
+    def __init__(self, module):
+        self.module = module
+
+    def heappush(self, heap, item):
+        Profiler.count('pushes')
+        self.module.heappush(heap, item)
+
+    def heappop(self, heap):
+        Profiler.count('nodes')
+        Profiler.count('expanded')
+        return self.module.heappop(heap)
+
+    def __getattr__(self, name):
+        return getattr(self.module, name) # the rest as they are
+
+def counted_deque(base):
+    # deque, counting pops for the active profiler
+    class CountedDeque(base):
+        original = base # to put back
+
+        def popleft(self):
+            Profiler.count('nodes')
+            return base.popleft(self)
+    return CountedDeque
+
 class Agent:
     def __init__(self):
-        self.env = {} # dict mapping relative co-ordinates to tile types
+        self.env = Grid() # grid mapping relative co-ordinates to tile types
 
         # env borders (mainly for show())
         self.border_n = 0
@@ -83,12 +1447,12 @@ class Agent:
         self.compass = Compass()
 
         # poi locations relative to start (as tuples)
-        self.axe = set()
-        self.key = set()
-        self.stone = set()
+        self.axe = Pois()
+        self.key = Pois()
+        self.stone = Pois()
         self.gold = None
-        self.trees = set()
-        self.doors = set()
+        self.trees = Pois()
+        self.doors = Pois()
 
         # need to store what agent has
         self.has_axe = False
@@ -97,35 +1461,275 @@ class Agent:
         self.has_gold = False
 
         self.plan_ahead = False
+        # budget for each plan ahead search, after which it gives up
+        self.plan_nodes = 200000
+        self.plan_time = 2.0 # seconds
+
+        # tiles from which unmapped areas can be seen
+        self.frontier = Frontier(self.env)
+        # which tiles are connected to which under each state
+        self.regions = Regions(self.env)
+        # distances from anchor tiles under each state, for estimates
+        self.landmarks = Landmarks(self.env, self.frontier)
+        # pathfind's recent answers
+        self.paths = PathCache(self.regions)
+        # whether to explore where the most would be seen per move rather
+        # than the nearest frontier
+        self.explore_gain = False
+
+        self.path = deque()
+        self.moves = deque()
+        # tiles the path depends on, and path_valid's answers since the path
+        # or one of those tiles last changed
+        self.watched = set()
+        self.validity = {}
 
-        self.path = []
-        self.moves = []
+        # incremental planners for repeated queries, least recently used first
+        self.planners = {}
+        # passability tables for distance fields by state
+        self.tables = {}
+        # the last tour worked out, as the items and state it was for and its
+        # first stop
+        self.stops = None
+        # crossings to targets by target and state, along with the number of
+        # changes to env when they were made
+        self.crossed = {}
+        self.changes = 0 # to env
 
         # agent loc
         self.x = 0
         self.y = 0
+        # OFFSETS as steps through the grid's cells, by heading and width
+        self.steps = {}
+
+        # maps from earlier games; while one is in use every tile the agent
+        # has seen for itself is also kept as first seen, i.e. before it
+        # picked anything up or placed stones, for checking the stored map
+        # against and storing the map at the end
+        self.store = MapStore(MAPS) if MAPS else None
+        self.map_key = None
+        self.prior = None
+        self.seen = Grid() if self.store else None
+        self.contradicted = False # a view has disagreed with the stored map
+
+        self.profiler = None
+        if PROFILE:
+            Profiler(PROFILE).install(self)
+
+        # map shared with other agents in the same world, if any (see join),
+        # the changes to env not yet published to it, the news read so far
+        # and when it last had nothing to do (None while it has)
+        self.shared = None
+        self.outbox = None
+        self.news = 0
+        self.waiting = None
+        self.stepping = False # holding a claim on the tile stepped onto
 
     def set_path(self, path):
-        self.path = path
-        self.moves = self.get_moves(path)
+        # paths from the planners are shortest in tiles, so unless they rely
+        # on picking things up or placing stones (planning ahead) the way to
+        # the same end taking the fewest actions is followed instead
+        moves = None
+        if len(path) > 2 and not self.plan_ahead:
+            path, moves = self.steer(path)
+        self.path = deque(path)
+        self.moves = deque(moves if moves is not None else self.get_moves(path))
+        self.watched = set(path)
+        self.validity.clear()
 
     def clear_path(self):
-        self.path = []
-        self.moves = []
+        self.path = deque()
+        self.moves = deque()
+        self.watched = set()
+        self.validity.clear()
+
+    def resync(self):
+        # pick the path back up from where the agent actually is, after it
+        # has taken actions other than the ones get_action returned
+        # as long as nothing the path relied on picking up or placing was
+        # skipped along the way
+        pos = (self.x, self.y)
+        path = self.path
+        if pos in path:
+            i = path.index(pos)
+            if all(self.env[step] in ' O' for step in islice(path, i)):
+                self.set_path(list(islice(path, i, None)))
+                return
+        elif path and abs(path[0][0] - pos[0]) + abs(path[0][1] - pos[1]) == 1:
+            self.set_path([pos] + list(path)) # a step it was going to take wasn't taken
+            return
+        self.clear_path()
+
+    def repair(self, target, num_stones = 0, optimistic = True):
+        # same as pathfind from the agent's position, but keeps the search
+        # for each target and state between ticks and only repairs it when
+        # tiles change rather than searching again from scratch
+        if self.plan_ahead:
+            # future states can't be repaired incrementally
+            return self.pathfind(target, num_stones, optimistic)
+        table = self.table(num_stones, optimistic, self.has_axe, self.has_key)
+        connected = self.regions.connected(table, (self.x, self.y), target)
+        if connected is False:
+            return [] # no path
+        key = (target, num_stones > 0, optimistic, self.has_axe, self.has_key)
+        planner = self.planners.pop(key, None)
+        if not planner:
+            planner = DStarLite(self, target, int(num_stones > 0), optimistic, self.has_axe, self.has_key)
+            if len(self.planners) >= 16:
+                del self.planners[next(iter(self.planners))]
+        self.planners[key] = planner
+        path = planner.plan((self.x, self.y))
+        if not path and connected:
+            self.regions.loose(table)
+        return path
+
+    def reach(self, groups, num_stones = 0, optimistic = True, has_axe = None, has_key = None, all = False):
+        # one search from the agent for several groups of targets, replacing
+        # a search per target. A group is a list of Pois. Returns the field
+        # searched and the reachable targets as (cost, pos) pairs, best
+        # first: earlier groups come first and each group is ordered by cost.
+        # Unless all are wanted the search stops at the nearest target of the
+        # first group that has any, so of the others only those at most as
+        # far are included.
+        # Targets in other regions are left out first, so no search is made
+        # at all when none of them can be reached. The targets are taken from
+        # the Pois nearest first and only out to as far as the search went,
+        # and the pairs are handed out lazily a group at a time, so targets
+        # that are far away or come after the one used cost next to nothing
+        start = (self.x, self.y)
+        table = self.table(num_stones, optimistic, has_axe or self.has_axe, has_key or self.has_key)
+        region = self.regions.region(table, start)
+
+        def near(group):
+            # (distance, pos) nearest first, in this region
+            pairs = group[0].nearest(start) if len(group) == 1 else heapq.merge(*(pois.nearest(start) for pois in group))
+            for d, pos in pairs:
+                if region is None or self.regions.region(table, pos) in (region, None):
+                    yield d, pos
+
+        first = None
+        for n, group in enumerate(groups):
+            first = list(near(group))
+            if first:
+                break
+        if not first:
+            return None, []
+        field = self.field(start, num_stones, optimistic, has_axe, has_key, () if all else [pos for _, pos in first])
+
+        def ranked():
+            found = False
+            for group in groups[n:]:
+                costs = []
+                for d, pos in first if group is groups[n] else near(group):
+                    if d > field.radius:
+                        break # can't have been reached
+                    costs.append((field.get(pos), pos))
+                for item in sorted(item for item in costs if item[0] is not None):
+                    found = True
+                    yield item
+            # only once they have all been tried
+            if not found and region is not None and any(self.regions.region(table, pos) == region for group in groups for pois in group for pos in pois):
+                self.regions.loose(table)
+        return field, ranked()
+
+    def field(self, source, num_stones = 0, optimistic = True, has_axe = None, has_key = None, targets = ()):
+        # distances from source to everywhere (or the nearest of targets)
+        # under the given state
+        has_axe = has_axe or self.has_axe
+        has_key = has_key or self.has_key
+        return DistanceField(self.env, source, self.table(num_stones, optimistic, has_axe, has_key), targets)
+
+    def crossings(self, target, optimistic = True, has_axe = None, has_key = None, env = None):
+        # Crossings to target under the given state, kept until env changes
+        has_axe = has_axe or self.has_axe
+        has_key = has_key or self.has_key
+        key = ('~', optimistic, has_axe, has_key)
+        table = self.tables.get(key)
+        if table is None:
+            table = self.tables[key] = crossing_table(optimistic, has_axe, has_key)
+        if env is not None and env is not self.env:
+            return Crossings(env, target, table)
+        key = (target,) + key
+        changes, crossings = self.crossed.get(key, (None, None))
+        if changes != self.changes:
+            if len(self.crossed) >= 16:
+                self.crossed.clear()
+            crossings = Crossings(self.env, target, table)
+            self.crossed[key] = (self.changes, crossings)
+        return crossings
+
+    def table(self, num_stones, optimistic, has_axe, has_key):
+        # passable_table for the state, made once
+        key = (num_stones > 0, optimistic, has_axe, has_key)
+        table = self.tables.get(key)
+        if table is None:
+            table = self.tables[key] = passable_table(*key)
+        return table
+
+    def set_tile(self, pos, tile):
+        # all changes to env go through here so planners and the frontier
+        # index hear about them
+        old = self.env.get(pos, '?')
+        if self.seen is not None and tile != '?' and pos not in self.seen:
+            self.first_seen(pos, tile)
+        if old != tile:
+            if self.outbox is not None and tile != '?':
+                self.outbox.append((pos, tile))
+            self.env[pos] = tile
+            self.changes += 1
+            if pos in self.watched:
+                self.validity.clear() # the path has to be checked again
+            for planner in self.planners.values():
+                planner.changed.add(pos)
+            self.regions.add(pos)
+            self.landmarks.add(pos)
+            if old == '?' and tile != '?':
+                self.frontier.reveal(pos)
+            elif tile == '?':
+                self.frontier.hide(pos)
+        elif pos not in self.env:
+            self.env[pos] = tile # a '?' where there was nothing
+            self.changes += 1
+            for planner in self.planners.values():
+                planner.changed.add(pos)
+            self.regions.add(pos)
+            self.landmarks.add(pos)
+
+    def cover(self, x0, y0, x1, y1):
+        # the rectangle from (x0, y0) to (x1, y1) has come within the
+        # borders, so its cells not in env become '?'. That's done to the
+        # grid's bytes in bulk, and the rest only hear about the rectangle:
+        # it makes no difference to states that don't treat '?' as passable,
+        # and those that do join it up a tile at a time when they're next
+        # used. The padding itself stays, since the searches only plan
+        # through the unknown by way of '?' tiles (an empty cell is out of
+        # bounds to them)
+        if not self.env.pad(x0, y0, x1, y1):
+            return
+        self.changes += 1
+        rect = (x0, y0, x1, y1)
+        for planner in self.planners.values():
+            if planner.optimistic:
+                planner.covered.append(rect)
+        self.regions.cover(rect)
+        self.landmarks.cover(rect)
 
     def get_action(self):
+        # the next action, or None once it has given up: sharing the map,
+        # there can come a point where neither it nor any other agent has
+        # anything left to do (see wait)
+        if self.stepping:
+            self.stepping = False
+            self.shared.claim(self.member, None, True)
         if self.has_gold:
             if not self.moves:
-                path = self.pathfind((0,0))
+                path = self.repair((0,0))
                 self.set_path(path)
-            else:
-                # check current path is still valid
-                for step in self.path:
-                    if not self.valid(step):
-                        path = self.pathfind((0,0))
-                        self.set_path(path)
-                        break
-            return self.moves.pop(0)
+            elif not self.path_valid():
+                # current path is no longer valid
+                path = self.repair((0,0))
+                self.set_path(path)
+            return self.moves.popleft()
 
         # search for path to gold
         if self.gold:
@@ -140,12 +1744,21 @@ class Agent:
             path = self.explore()
             if path:
                 self.set_path(path)
+            elif self.plan_ahead and self.shared:
+                # nothing left to do alone, but its stones could open the
+                # way for another agent's tools, or another agent could
+                # open it
+                if not self.hand_over():
+                    return self.wait()
             else:
                 # enable planning ahead to deploy stones
                 # this should only ever happen once
                 self.plan_ahead = True
                 return self.get_action()
 
+        if self.waiting is not None:
+            self.waiting = None
+            self.shared.report(self.member, SharedMap.BUSY, self.has_axe, self.has_key, self.num_stones)
         if self.moves[0] == 'f':
             next_tile = self.path[1]
             # remove obstacles if necessary
@@ -153,147 +1766,376 @@ class Agent:
                 return 'c'
             elif self.env[next_tile] == '-':
                 return 'u'
+            if self.shared and self.env[next_tile] in '~oak$':
+                # stepping there changes it, so not in the same turn as
+                # another agent (see SharedMap): turn and back if it is
+                if not self.shared.claim(self.member, self.to_world(next_tile), True):
+                    self.moves.appendleft('r')
+                    return 'l'
+                self.stepping = True
             # update path
-            self.path.pop(0)
-        return self.moves.pop(0)
+            self.path.popleft()
+            if not all(self.validity.values()):
+                self.validity.clear() # what was in the way may be behind now
+        return self.moves.popleft()
+
+    def hand_over(self):
+        # stones can't be handed over, but they can be put where another
+        # agent sharing the map needs them: with the tools and stones of the
+        # others as well, there can be ways to the gold, or to see more of
+        # the map, that it can't go alone. So it goes along the nearest such
+        # way as far as it can by itself, placing its stones on the way, for
+        # the others to go on from. Returns whether it's going, i.e. would
+        # place any
+        if not self.num_stones:
+            return False
+        has_axe, has_key, num_stones = self.shared.tools(self.member)
+        has_axe = has_axe or self.has_axe
+        has_key = has_key or self.has_key
+        num_stones += self.num_stones
+        if has_axe == self.has_axe and has_key == self.has_key and num_stones == self.num_stones:
+            return False # nothing the others have that it doesn't
+        env = self.env
+        field = self.field((self.x, self.y), num_stones, False, has_axe, has_key)
+        frontier = [pos for pos in self.frontier.unknown if passable(env[pos], 0, False, has_axe, has_key)]
+        frontier = sorted((pos for pos in frontier if field.get(pos) is not None), key = field.get)
+        for target in ([self.gold] if self.gold else []) + frontier:
+            path = self.pathfind(target, num_stones, False, None, None, has_axe, has_key)
+            stones = self.num_stones
+            for k, pos in enumerate(path):
+                if env[pos] == 'T' and not self.has_axe or env[pos] == '-' and not self.has_key:
+                    break
+                if env[pos] == '~':
+                    if not stones:
+                        break
+                    stones -= 1
+            else:
+                k = len(path)
+            if stones < self.num_stones:
+                self.set_path(path[:k])
+                return True
+        return False
+
+    def wait(self):
+        # nothing to do until another agent sharing the map changes it, so
+        # turn on the spot, which changes nothing. Once every agent is
+        # waiting with no news since, none of them ever will
+        if self.waiting != self.news:
+            self.waiting = self.news
+            self.shared.report(self.member, self.waiting, self.has_axe, self.has_key, self.num_stones)
+        if self.shared.stalled():
+            # give up, leaving whatever it was heading for to the others
+            self.shared.claim(self.member, None)
+            self.shared.report(self.member, SharedMap.DONE, False, False, 0)
+            return None
+        return 'l'
+
+    def safe_moves(self):
+        # moves that can be made without any planning, for when there's no
+        # time to think: along the current path, or else towards the nearest
+        # unexplored area, up to the first tile that isn't plain land
+        if self.moves:
+            path = self.path
+            moves = self.moves
+        else:
+            path = self.explore()
+            moves = self.get_moves(path)
+        safe = []
+        steps = iter(path)
+        next(steps, None) # where the agent is
+        for move in moves:
+            if move == 'f' and self.env.get(next(steps)) not in ' Oaok$':
+                break # water, obstacles and unknowns need thought
+            safe.append(move)
+        return safe
+
+    def path_valid(self, num_stones = 0, pick_up = False):
+        # whether the current path can still be followed, counting the
+        # stones picked up along the way if pick_up. The answer only changes
+        # when the path, the inventory or a tile on the path does, so it's
+        # only worked out again then (set_tile drops the answers when a
+        # watched tile changes)
+        key = (num_stones, pick_up, self.has_axe, self.has_key)
+        valid = self.validity.get(key)
+        if valid is None:
+            valid = self.validity[key] = self.walk_path(num_stones, pick_up)
+        return valid
+
+    def walk_path(self, num_stones, pick_up):
+        for step in self.path:
+            if not self.valid(step, num_stones):
+                return False
+            elif pick_up and self.env[step] == 'o':
+                num_stones += 1
+        return True
 
     def check_gold(self):
         if self.path and self.path[-1] == self.gold:
             # current path is to gold
             # so need to check path is still valid
-            valid = True
-            num_stones = self.num_stones
-            for step in self.path:
-                if not self.valid(step, num_stones):
-                    valid = False
-                    break
-                elif self.env[step] == 'o':
-                    num_stones += 1
-            if valid:
+            if self.path_valid(self.num_stones, True):
                 # previous path is still valid, just continue with it
                 return
             else:
                 # previous path is no longer valid so clear it
                 self.clear_path()
         # first check for definite path
-        path = self.pathfind(self.gold, 0 if not self.plan_ahead else self.num_stones, False) 
+        path = self.repair(self.gold, 0 if not self.plan_ahead else self.num_stones, False) 
         if not path:
             # else check for path with unknowns
-            path = self.pathfind(self.gold)
+            path = self.repair(self.gold)
+        if path and self.shared and not self.shared.claim(self.member, self.to_world(self.gold)):
+            return # another agent sharing the map is heading for it
         if path:
             self.set_path(path)
 
     def check_pois(self, num_stones = 0):
         # create a poi list in priority order
-        pois = list(self.stone)
+        pois = [self.stone]
         if not self.has_key:
-            pois += list(self.key)
+            pois.append(self.key)
         if not self.has_axe:
-            pois += list(self.axe)
-        pois = sorted(pois, key = lambda pos: abs(pos[0] - self.x) + abs(pos[1] - self.y))
-
+            pois.append(self.axe)
         # go out of way to cut down doors since traditionally more interesting?
         # (even though mechanically the same as trees)
-        if self.has_key:
-            pois += sorted(self.doors, key = lambda pos: abs(pos[0] - self.x) + abs(pos[1] - self.y))
+        doors = [self.doors] if self.has_key else []
         # dont go out of way to cut down trees since often just obstacles
-        if self.has_axe:
-            pois += sorted(self.trees, key = lambda pos: abs(pos[0] - self.x) + abs(pos[1] - self.y))
+        trees = [self.trees] if self.has_axe else []
+        if not any(pois + doors + trees):
+            return
+
+        claimed = set(map(self.from_world, self.shared.claimed(self.member))) if self.shared else ()
+        if not self.plan_ahead:
+            # pick things up in the order that takes the fewest moves
+            stop = self.tour(num_stones, claimed)
+            if stop and self.shared and not self.shared.claim(self.member, self.to_world(stop[0])):
+                # another agent has just taken it, so pick from the rest
+                claimed.add(stop[0])
+                stop = None
+            if stop:
+                pos, path = stop
+                if path:
+                    self.set_path(path) # otherwise the path there still holds
+                return
+
+        if self.plan_ahead:
+            # be generous since the lookahead can pick things up on the way,
+            # and it may fail anyway so rank them all
+            _, ranked = self.reach([pois, doors, trees], num_stones + len(self.stone), True, self.has_axe or bool(self.axe), self.has_key or bool(self.key), True)
+        else:
+            field, ranked = self.reach([pois, doors, trees], num_stones)
 
-        # search for paths to each poi in priority order
-        while pois:
-            pos = pois.pop(0)
+        # go to the pois in priority order, leaving any that another agent
+        # sharing the map is heading for to it
+        for _, pos in ranked:
+            if pos in claimed:
+                continue
             if self.path and pos == self.path[-1]:
                 # this poi was the previous target and there were no paths to pois of higher priority
                 # check that the previous path is still valid
-                valid = True
-                for step in self.path:
-                    if not self.valid(step):
-                        valid = False
-                        break
-                if valid:
+                if self.path_valid():
                     # previous path is still valid, just continue with it
                     return
                 else:
                     # previous path is no longer valid so clear it
                     self.clear_path()
-            path = self.pathfind(pos, num_stones)
+            if self.plan_ahead:
+                path = self.pathfind(pos, num_stones)
+            else:
+                path = field.path_to(pos) # already found by the search
+            if path and self.shared and not self.shared.claim(self.member, self.to_world(pos)):
+                continue # another agent has just taken it
             if path:
                 self.set_path(path)
                 return # a path has been found so use it
 
+        if self.path and any(self.path[-1] in group for group in pois + doors + trees):
+            # the previous target can't be reached any more
+            self.clear_path()
+
+    def tour(self, num_stones, claimed):
+        # The order to pick up the axe, key and stones in that takes the
+        # fewest moves, as a travelling salesman problem solved exactly by
+        # dynamic programming over the sets of them picked up so far
+        # (Held-Karp). The distances between them depend on what's been
+        # picked up, the axe opening up trees and the key doors, so they come
+        # from a distance field per tile and state. With the gold known the
+        # tour may end at it and then home instead, leaving out anything not
+        # worth the detour; otherwise every one that can be reached is
+        # visited, in the order that adds up to the fewest moves. Beyond TOUR
+        # of them only the tools and the nearest are put in order, the rest
+        # waiting until those have been picked up.
+        # Returns the first stop and a path to it (None if the agent's path
+        # still leads there), the stop being the gold itself if nothing is
+        # worth picking up on the way to it, or None if there's nothing that
+        # can be reached to pick up
+        start = (self.x, self.y)
+        items = [(pos, 1) for pos in self.axe if not self.has_axe] + [(pos, 2) for pos in self.key if not self.has_key]
+        items += [(pos, 0) for pos in self.stone]
+        # leaving out those in other regions even with every tool there is
+        table = self.table(num_stones, True, self.has_axe or bool(self.axe), self.has_key or bool(self.key))
+        region = self.regions.region(table, start)
+        items = [item for item in items if item[0] not in claimed and (region is None or self.regions.region(table, item[0]) in (region, None))]
+        if not items:
+            return None
+        gold = self.gold if self.gold and not self.has_gold else None
+        key = (frozenset(items), gold, self.has_axe, self.has_key)
+        if self.stops and self.stops[0] == key and self.path and self.path[-1] == self.stops[1] and self.path_valid():
+            return self.stops[1], None
+
+        targets = [pos for pos, _ in items] + ([gold] if gold else [])
+        fields = {}
+
+        def costs(i, state):
+            # moves from node i (0 for the agent) to every node, then the
+            # gold, under state (1 with the axe, 2 with the key), searching
+            # only until those in the same region have all been reached
+            row = fields.get((i, state))
+            if row is None:
+                table = self.table(num_stones, True, bool(state & 1), bool(state & 2))
+                region = self.regions.region(table, nodes[i])
+                near = [pos for pos in targets if self.regions.region(table, pos) in (region, None)]
+                if near:
+                    field = DistanceField(self.env, nodes[i], table, near, True)
+                    row = [field] + [field.get(pos) for pos in nodes[1:]] + [field.get(gold) if gold else None]
+                else:
+                    row = [None] * (len(nodes) + 1)
+                fields[(i, state)] = row
+            return row
+
+        have = int(self.has_axe) | int(self.has_key) << 1
+        nodes = [start] + [pos for pos, _ in items]
+        if len(items) > TOUR:
+            # the tools and then the nearest that can be reached now
+            row = costs(0, have)
+            order = sorted(range(len(items)), key = lambda k: (items[k][1] == 0, row[k + 1] is None, row[k + 1] or 0))
+            items = [items[k] for k in order[:TOUR]]
+            nodes = [start] + [pos for pos, _ in items]
+            fields.clear()
+        n = len(items)
+        full = 1 << n
+
+        home = {}
+        def finish(state):
+            # moves from the gold back home under state
+            if state not in home:
+                home[state] = self.field(gold, num_stones, True, bool(state & 1), bool(state & 2), [(0,0)]).get((0,0))
+            return home[state]
+
+        # best[mask][j] is the fewest moves to pick up those in mask ending
+        # with j, by way of back[mask][j]
+        state = [have] * full
+        for mask in range(1, full):
+            low = (mask & -mask).bit_length() - 1
+            state[mask] = state[mask & (mask - 1)] | items[low][1]
+        best = [[INF] * n for _ in range(full)]
+        back = [[-1] * n for _ in range(full)]
+        row = costs(0, have)
+        for j in range(n):
+            if row[j + 1] is not None:
+                best[1 << j][j] = row[j + 1]
+        for mask in range(1, full):
+            for i in range(n):
+                cost = best[mask][i]
+                if cost == INF:
+                    continue
+                row = costs(i + 1, state[mask])
+                for j in range(n):
+                    d = row[j + 1]
+                    if d is not None and not mask >> j & 1 and cost + d < best[mask | 1 << j][j]:
+                        best[mask | 1 << j][j] = cost + d
+                        back[mask | 1 << j][j] = i
+
+        end = None # (mask, last)
+        if gold:
+            # on to the gold and home
+            row = costs(0, have)
+            least = INF
+            if row[-1] is not None and finish(have) is not None:
+                least = row[-1] + finish(have)
+            for mask in range(1, full):
+                for j in range(n):
+                    if best[mask][j] < least:
+                        row = costs(j + 1, state[mask])
+                        if row[-1] is not None and finish(state[mask]) is not None and best[mask][j] + row[-1] + finish(state[mask]) < least:
+                            least = best[mask][j] + row[-1] + finish(state[mask])
+                            end = (mask, j)
+            if end is None and least < INF:
+                # nothing is worth picking up on the way
+                self.stops = (key, gold)
+                return gold, costs(0, have)[0].path_to(gold)
+        if end is None:
+            # as many as can be reached, fewest moves first
+            most = (0, 0)
+            for mask in range(1, full):
+                count = bin(mask).count('1')
+                for j in range(n):
+                    if best[mask][j] < INF and (count, -best[mask][j]) > most:
+                        most = (count, -best[mask][j])
+                        end = (mask, j)
+        if end is None:
+            return None
+
+        mask, j = end
+        stops = []
+        while j >= 0:
+            stops.append(items[j][0])
+            mask, j = mask ^ 1 << j, back[mask][j]
+        stops.reverse()
+        self.stops = (key, stops[0])
+        return stops[0], costs(0, have)[0].path_to(stops[0])
+
     def explore(self):
-        seen = {}
-        queue = [(self.x, self.y)]
-        while len(queue) > 0:
-            pos = queue.pop(0)
+        # breadth-first search outwards from the agent for the nearest tile
+        # in the frontier index, i.e. one from which unmapped areas are seen.
+        # Only known tiles are searched since any unknown tile next to them
+        # makes them part of the frontier anyway
+        # With other agents about, tiles near those they're heading for are
+        # left to them unless there's nothing else
+        start = (self.x, self.y)
+        frontier = self.frontier.unknown
+        claimed = [self.from_world(pos) for pos in self.shared.claimed(self.member)] if self.shared else []
+        seen = {start: None}
+        queue = deque([(start, 0)])
+        best = None
+        fallback = None
+        score = 0
+        while queue:
+            pos, dist = queue.popleft()
+            if self.explore_gain and WINDOW / (dist + 1) <= score:
+                break # nothing further away can beat the best so far
             a, b = pos
-            
-            # expand n
-            x = a
-            y = b + 1
-            if (x,y) not in seen and self.valid((x,y)):
-                seen[(x,y)] = (a,b)
-                for x1 in range(x-2,x+3):
-                    if (x1,y+2) not in self.env or self.env[(x1,y+2)] == '?':
-                        step = (x,y)
-                        path = [step]
-                        while step != (self.x,self.y):
-                            step = seen[step]
-                            path.append(step)
-                        path.reverse()
-                        return path
-                queue.append((x,y))
-
-            # expand e
-            x = a + 1
-            y = b
-            if (x,y) not in seen and self.valid((x,y)):
-                seen[(x,y)] = (a,b)
-                for y1 in range(y-2,y+3):
-                    if (x+2, y1) not in self.env or self.env[(x+2,y1)] == '?':
-                        step = (x,y)
-                        path = [step]
-                        while step != (self.x,self.y):
-                            step = seen[step]
-                            path.append(step)
-                        path.reverse()
-                        return path
-                queue.append((x,y))
-
-            # expand s
-            x = a
-            y = b - 1
-            if (x,y) not in seen and self.valid((x,y)):
-                seen[(x,y)] = (a,b)
-                for x1 in range(x-2,x+3):
-                    if (x1, y-2) not in self.env or self.env[(x1,y-2)] == '?':
-                        step = (x,y)
-                        path = [step]
-                        while step != (self.x,self.y):
-                            step = seen[step]
-                            path.append(step)
-                        path.reverse()
-                        return path
-                queue.append((x,y))
-
-            # expand w
-            x = a - 1
-            y = b
-            if (x,y) not in seen and self.valid((x,y)):
-                seen[(x,y)] = (a,b)
-                for y1 in range(y-2,y+3):
-                    if (x-2, y1) not in self.env or self.env[(x-2,y1)] == '?':
-                        step = (x,y)
-                        path = [step]
-                        while step != (self.x,self.y):
-                            step = seen[step]
-                            path.append(step)
-                        path.reverse()
-                        return path
-                queue.append((x,y))
+            for exp in [(a,b+1), (a+1,b), (a,b-1), (a-1,b)]:
+                if exp not in seen and self.valid(exp, 0, False):
+                    seen[exp] = pos
+                    if exp in frontier:
+                        if claimed and any(abs(exp[0] - x) + abs(exp[1] - y) <= SPREAD for x, y in claimed):
+                            fallback = fallback or exp
+                        elif not self.explore_gain:
+                            best = exp
+                            break
+                        else:
+                            # weigh how much would be seen against getting there
+                            gain = frontier[exp] / (dist + 2)
+                            if gain > score:
+                                best = exp
+                                score = gain
+                    queue.append((exp, dist + 1))
+            if best and not self.explore_gain:
+                break
 
-        return [] # no path
+        best = best or fallback
+        if self.shared and not self.shared.claim(self.member, best and self.to_world(best)):
+            self.shared.claim(self.member, None) # heading for another's, as there's nothing else
+        if not best:
+            return [] # no path
+        step = best
+        path = []
+        while step:
+            path.append(step)
+            step = seen[step]
+        path.reverse()
+        return path
 
     def get_moves(self, path):
         # convert path to sequence of moves
@@ -370,64 +2212,399 @@ class Agent:
             moves.append('f')
         return moves
 
+    def steer(self, path):
+        # A* over (tile, heading) from where the agent is and the way it
+        # faces to the end of path, for the path there taking the fewest
+        # actions rather than tiles: turning costs one, going forward one,
+        # and chopping or unlocking on the way one more. The estimate is the
+        # distance plus the turns it will take to face every way still to be
+        # gone, which never overestimates. Only tiles known to be passable
+        # without stones, and the path's own, are used, so the way found is
+        # no riskier than the path, and it's never worse since the path's
+        # own actions bound the search. Returns the path and its actions
+        env = self.env
+        cells = env.cells
+        width = env.width
+        steps = [width, 1, -width, -1] # nesw as in search
+        s = env.index(path[0])
+        t = env.index(path[-1])
+        bound = len(self.get_moves(path))
+        if s < 0 or t < 0:
+            return path, None
+        table = self.table(0, False, self.has_axe, self.has_key)
+        own = set(map(env.index, path))
+        c = (t % width) # target in cells
+        d = (t // width)
+        size = len(cells) * 4 # a state is a tile and a heading
+        bits = size.bit_length()
+        mask = (1 << bits) - 1
+        cost = array('i', [size]) * size
+        parent = array('i', [-1]) * size
+        action = bytearray(size) # how each state was got to
+        first = s * 4 + self.compass.i
+        cost[first] = 0
+        queue = [first]
+        while queue:
+            entry = heapq.heappop(queue)
+            state = entry & mask
+            g = entry >> bits & mask
+            if g > cost[state]:
+                continue # already expanded more cheaply
+            i, h = divmod(state, 4)
+            if i == t:
+                break
+            n = i + steps[h]
+            tile = cells[n]
+            if table[tile] or n in own:
+                kind = 3 if tile == 84 else 4 if tile == 45 else 2 # chop a 'T' or unlock a '-' first
+                moves = [(n * 4 + h, kind - 1, kind), (i * 4 + (h - 1) % 4, 1, 0), (i * 4 + (h + 1) % 4, 1, 1)]
+            else:
+                moves = [(i * 4 + (h - 1) % 4, 1, 0), (i * 4 + (h + 1) % 4, 1, 1)]
+            for next_state, step, kind in moves:
+                next_g = g + step
+                if next_g < cost[next_state]:
+                    j, k = divmod(next_state, 4)
+                    y, x = divmod(j, width)
+                    dx = c - x
+                    dy = d - y
+                    ways = ([0] if dy > 0 else [2] if dy < 0 else []) + ([1] if dx > 0 else [3] if dx < 0 else [])
+                    if not ways:
+                        turns = 0
+                    elif k in ways:
+                        turns = len(ways) - 1
+                    elif len(ways) == 1 and (k - ways[0]) % 2:
+                        turns = 1 # a quarter turn away
+                    else:
+                        turns = 2
+                    dist = abs(dx) + abs(dy) + turns + next_g
+                    if dist > bound:
+                        continue # no better than the path
+                    cost[next_state] = next_g
+                    parent[next_state] = state
+                    action[next_state] = kind
+                    heapq.heappush(queue, ((dist << bits | next_g) << bits) | next_state)
+        else:
+            return path, None # as it was
+
+        steered = []
+        moves = []
+        while state != first:
+            kind = action[state]
+            moves.append(['l', 'r', 'f', 'cf', 'uf'][kind])
+            if kind >= 2:
+                steered.append((env.x0 + state // 4 % width, env.y0 + state // 4 // width))
+            state = parent[state]
+        steered.append(path[0])
+        steered.reverse()
+        moves.reverse()
+        return steered, list(''.join(moves))
+
     def pathfind(self, target, num_stones = 0, optimistic = True, start = None, env = None, has_axe = None, has_key = None):
-        c, d = target
         start = start or (self.x, self.y)
         env = env or self.env
         has_axe = has_axe or self.has_axe
         has_key = has_key or self.has_key
+        if env is not self.env:
+            return self.route(target, num_stones, optimistic, start, env, has_axe, has_key)
+        # the same questions come up tick after tick, so the answers are kept
+        # while the map they depend on stays the same
+        key = (start, target, num_stones if self.plan_ahead else num_stones > 0, optimistic, has_axe, has_key, self.plan_ahead)
+        path = self.paths.get(key)
+        if path is None:
+            path = self.route(target, num_stones, optimistic, start, env, has_axe, has_key)
+            self.paths.put(key, path)
+        return path
 
-        seen = set([start])
+    def route(self, target, num_stones, optimistic, start, env, has_axe, has_key):
+        # pathfind's search itself
+        c, d = target
+        if self.plan_ahead:
+            return self.lookahead(target, num_stones, optimistic, start, env, has_axe, has_key)
 
-        queue = [(0, start, [])]
-        # insert nodes into queue based on mdist + prev cost
-        # first val is est cost to goal, second is pos, third is list of prior nodes i.e. path ending in pos
-        # first val being 0 is dummy since will immediately be popped
+        table = self.table(num_stones, optimistic, has_axe, has_key)
+        if env is not self.env:
+            return self.search(target, start, env, table)
+        # rule out targets in other regions. Long searches jump across open
+        # ground
+        connected = self.regions.connected(table, start, target)
+        if connected is False:
+            return [] # no path
+        far = abs(start[0] - c) + abs(start[1] - d)
+        search = self.jump if far > JUMP_AFTER else self.search
+        path = search(target, start, env, table)
+        if not path and connected:
+            self.regions.loose(table)
+        return path
 
-        while len(queue) > 0:
-            _ , pos, path = heapq.heappop(queue)
+    def search(self, target, start, env, table):
+        # A* for pathfind. Nodes are indices into env's cells, so the
+        # neighbours of a node are at fixed offsets and are always inside the
+        # grid (see Grid). Costs so far and parents are kept in flat arrays
+        # over the cells, and queue entries are ints packing the est cost to
+        # goal (estimate + cost so far), then the cost so far (so ties go to
+        # the cheaper node) and then the node, so they compare quickly and
+        # hold no path: the path is only put together once the target is
+        # reached. The estimate is the Manhattan distance, raised by the
+        # landmarks on env
+        c, d = target
+        cells = env.cells
+        width = env.width
+        s = env.index(start)
+        t = env.index(target)
+        if s < 0 or t < 0 or not cells[s] or not table[cells[t]]:
+            return [] # no path
+        c -= env.x0 # target in cells
+        d -= env.y0
+        size = len(cells)
+        bits = size.bit_length()
+        mask = (1 << bits) - 1
+        cost = array('i', [size]) * size # no path is as long as size
+        parent = array('i', [-1]) * size
+        pairs = self.landmarks.toward(table, target) if env is self.env else []
+        lower = Landmarks.bound
+        cost[s] = 0
+        queue = [s]
+        while queue:
+            entry = heapq.heappop(queue)
+            i = entry & mask
+            g = entry >> bits & mask
+            if g > cost[i]:
+                continue # already expanded more cheaply
+            if i == t:
+                break
+            g += 1
+            for n in (i + width, i + 1, i - width, i - 1): # nesw
+                if g < cost[n] and table[cells[n]]:
+                    y, x = divmod(n, width)
+                    cost[n] = g
+                    parent[n] = i
+                    h = abs(x - c) + abs(y - d)
+                    if pairs:
+                        h = lower(pairs, n, h)
+                    heapq.heappush(queue, ((h + g << bits | g) << bits) | n)
+        else:
+            return [] # no path
 
-            if pos == target:
-                return [start] + path
+        path = []
+        i = t
+        while i != s:
+            path.append((env.x0 + i % width, env.y0 + i // width))
+            i = parent[i]
+        path.append(start)
+        path.reverse()
+        return path
 
-            # if num_stones < 0:
-            #     print('This shouldnt happen')
-            #     continue
+    def jump(self, target, start, env, table):
+        # Jump Point Search (for four ways of moving) in place of search,
+        # giving paths just as short with far fewer nodes over open ground.
+        # As every step costs the same, of the many equally short ways
+        # across open ground only one needs finding: going vertically first,
+        # turning horizontally anywhere, but only turning vertically again
+        # where the way was blocked just behind the turn (a forced
+        # neighbour). So tiles are passed over in straight jumps rather than
+        # pushed, and only those where a turn could be wanted become nodes: a
+        # horizontal jump stops where a forced neighbour opens up, and a
+        # vertical jump where a horizontal one from it would stop somewhere.
+        # Special tiles (water, trees, doors, things to pick up and unknowns)
+        # and the target always stop a jump and are expanded every way, as
+        # search would. Nodes and queue entries are as in search, with the
+        # way each node was got to kept alongside
+        cells = env.cells
+        width = env.width
+        s = env.index(start)
+        t = env.index(target)
+        if s < 0 or t < 0 or not cells[s] or not table[cells[t]]:
+            return [] # no path
+        c = t % width # target in cells
+        d = t // width
+        kinds = self.tables.get(('jump', table))
+        if kinds is None:
+            # 0 for impassable, 2 for special and 1 for the rest
+            kinds = self.tables[('jump', table)] = bytes(table[i] and 1 + SPECIAL[i] for i in range(256))
+        mask = cells.translate(kinds)
 
-            prev = len(path)
-            a, b = pos
-            expansions = [(a,b+1), (a+1,b), (a,b-1), (a-1,b)] # nesw
-            
-            for exp in expansions:
-                if exp not in seen and self.valid(exp, num_stones, optimistic, env, has_axe, has_key):
-                    if self.plan_ahead and env[exp] == '~':
-                        next_env = env.copy()
-                        next_env[exp] = 'O'
-                        next_path = self.pathfind(target, num_stones - 1, False, exp, next_env, has_axe, has_key)
-                        if next_path:
-                            return [start] + path + next_path
-                    elif self.plan_ahead and env[exp] == 'o':
-                        next_env = env.copy()
-                        next_env[exp] = ' '
-                        next_path = self.pathfind(target, num_stones + 1, False, exp, next_env, has_axe, has_key)
-                        if next_path:
-                            return [start] + path + next_path
-                    elif self.plan_ahead and env[exp] == 'a' and not has_axe:
-                        next_env = env.copy()
-                        next_env[exp] = ' '
-                        next_path = self.pathfind(target, num_stones, False, exp, next_env, True, has_key)
-                        if next_path:
-                            return [start] + path + next_path
-                    elif self.plan_ahead and env[exp] == 'k' and not has_key:
-                        next_env = env.copy()
-                        next_env[exp] = ' '
-                        next_path = self.pathfind(target, num_stones, False, exp, next_env, has_axe, True)
-                        if next_path:
-                            return [start] + path + next_path
-                    else:
-                        dist = abs(x - c) + abs(y - d) + prev # manhattan distance + cost to get to exp from (a,b)
-                        heapq.heappush(queue, (dist, exp, path + [exp]))
-                    seen.add(exp)
+        def across(i, step):
+            # the node a horizontal jump from i stops at, or -1 if it's
+            # blocked first
+            up = width - step
+            down = -width - step
+            while True:
+                i += step
+                kind = mask[i]
+                if not kind:
+                    return -1
+                if kind == 2 or i == t:
+                    return i
+                if (mask[i + width] and not mask[i + up]) or (mask[i - width] and not mask[i + down]):
+                    return i # forced neighbour
+
+        def along(i, step):
+            # the same for a vertical jump
+            while True:
+                i += step
+                kind = mask[i]
+                if not kind:
+                    return -1
+                if kind == 2 or i == t or across(i, 1) >= 0 or across(i, -1) >= 0:
+                    return i
+
+        size = len(cells)
+        bits = size.bit_length()
+        bitmask = (1 << bits) - 1
+        cost = array('i', [size]) * size
+        parent = array('i', [-1]) * size
+        way = bytearray(size) # step each node was got by, as an index into steps plus one (0 for every way)
+        steps = (width, 1, -width, -1) # nesw as in search
+        pairs = self.landmarks.toward(table, target) if env is self.env else []
+        lower = Landmarks.bound
+        cost[s] = 0
+        queue = [s]
+        while queue:
+            entry = heapq.heappop(queue)
+            i = entry & bitmask
+            g = entry >> bits & bitmask
+            if g > cost[i]:
+                continue # already expanded more cheaply
+            if i == t:
+                break
+            k = way[i] - 1
+            if k < 0 or mask[i] == 2:
+                ways = (0, 1, 2, 3)
+            elif k % 2:
+                # horizontally, so on that way and vertically if forced
+                step = steps[k]
+                ways = [k]
+                if mask[i + width] and not mask[i + width - step]:
+                    ways.append(0)
+                if mask[i - width] and not mask[i - width - step]:
+                    ways.append(2)
+            else:
+                ways = (k, 1, 3) # vertically, so on that way or turning
+            for k in ways:
+                step = steps[k]
+                n = across(i, step) if k % 2 else along(i, step)
+                if n < 0:
+                    continue
+                next_g = g + (n - i) // step
+                if next_g < cost[n]:
+                    cost[n] = next_g
+                    parent[n] = i
+                    way[n] = k + 1
+                    y, x = divmod(n, width)
+                    h = abs(x - c) + abs(y - d)
+                    if pairs:
+                        h = lower(pairs, n, h)
+                    heapq.heappush(queue, ((h + next_g << bits | next_g) << bits) | n)
+        else:
+            return [] # no path
+
+        # fill in the tiles jumped over
+        path = []
+        i = t
+        while i != s:
+            j = parent[i]
+            step = steps[way[i] - 1]
+            while i != j:
+                path.append((env.x0 + i % width, env.y0 + i // width))
+                i -= step
+        path.append(start)
+        path.reverse()
+        return path
+
+    def lookahead(self, target, num_stones, optimistic, start, env, has_axe, has_key):
+        # A* over future states rather than just positions. A state is the
+        # position, stones held, whether the axe and key are held and a
+        # bitmask of which junction tiles (stones, tools and water) have been
+        # used up along the way, so the map itself is never copied: a tile's
+        # future type is its type in env with its bit applied. Each state is
+        # expanded at most once, and the search gives up (no path) once it
+        # goes over its node or time budget. As before, only known tiles are
+        # considered once a junction has been passed.
+        # Most searches end within a few hundred nodes, so only once one has
+        # run on for a while are the crossings to the target (with every tool
+        # on the map to hand) worked out. They end it at once if there aren't
+        # enough stones in the world to get there, and from then on rule out
+        # any state that hasn't got enough left to get there from where it
+        # is, such as after placing a stone somewhere useless. Stones placed
+        # earlier on the way don't need placing again, so they count towards
+        # what it has left.
+        c, d = target
+        crossings = None # not worked out yet
+        spare = 0 # stones lying about
+        water = 0 # bits of water tiles
+        found = 0 # bits of stones picked up
+        bits = {} # junction tile to its bit in the mask
+        state = (start[0], start[1], num_stones, has_axe, has_key, 0)
+        parents = {state: None}
+        cost = {state: 0}
+        queue = [(0, 0, state)]
+        nodes = 0
+        deadline = time.time() + self.plan_time
+
+        while queue:
+            _, g, state = heapq.heappop(queue)
+            if g > cost[state]:
+                continue # already expanded more cheaply
+            a, b, stones, axe, key, used = state
+            if (a, b) == target:
+                path = []
+                while state:
+                    path.append((state[0], state[1]))
+                    state = parents[state]
+                path.reverse()
+                return path
+
+            nodes += 1
+            if nodes > self.plan_nodes or (nodes % 1024 == 0 and time.time() > deadline):
+                return [] # over budget
+            if nodes == PRUNE_AFTER:
+                crossings = self.crossings(target, optimistic, has_axe or bool(self.axe), has_key or bool(self.key), env)
+                spare = env.cells.count(ord('o'))
+                need = crossings.get(start)
+                if need is None or need > num_stones + spare:
+                    return [] # no path
+
+            for exp in [(a,b+1), (a+1,b), (a,b-1), (a-1,b)]:
+                tile = env.get(exp)
+                if tile is None:
+                    continue # out of borders
+                bit = bits.get(exp)
+                if bit is not None and used >> bit & 1:
+                    tile = 'O' if tile == '~' else ' ' # used up earlier on
+                if not passable(tile, stones, optimistic and not used, axe, key):
+                    continue
+                next_stones = stones
+                next_axe = axe
+                next_key = key
+                next_used = used
+                if tile == '~':
+                    next_stones -= 1 # place stone
+                elif tile == 'o':
+                    next_stones += 1
+                elif tile == 'a' and not axe:
+                    next_axe = True
+                elif tile == 'k' and not key:
+                    next_key = True
+                if next_stones != stones or next_axe != axe or next_key != key:
+                    if bit is None:
+                        bit = bits[exp] = len(bits)
+                        if tile == '~':
+                            water |= 1 << bit
+                        elif tile == 'o':
+                            found |= 1 << bit
+                    next_used |= 1 << bit
+                if crossings is not None:
+                    need = crossings.get(exp)
+                    if need is None:
+                        continue # can't get there from here
+                    if need > next_stones and need > next_stones + spare - bin(next_used & found).count('1') + bin(next_used & water).count('1'):
+                        continue # not enough stones left, a dead end
+                next_state = (exp[0], exp[1], next_stones, next_axe, next_key, next_used)
+                if g + 1 < cost.get(next_state, INF):
+                    cost[next_state] = g + 1
+                    parents[next_state] = state
+                    dist = g + 1 + abs(exp[0] - c) + abs(exp[1] - d)
+                    heapq.heappush(queue, (dist, g + 1, next_state))
 
         return [] # no path
 
@@ -435,41 +2612,41 @@ class Agent:
         env = env or self.env
         has_axe = has_axe or self.has_axe
         has_key = has_key or self.has_key
-        if pos not in env:
+        tile = env.get(pos)
+        if tile is None:
             return False # out of borders
-        tile = env[pos]
-        if not optimistic and tile == '?':
-            return False
-        elif tile == '*':
-            return False
-        elif tile == '.':
-            return False
-        elif tile == 'T' and has_axe == False:
-            return False
-        elif tile == '-' and has_key == False:
-            return False
-        elif tile == '~' and num_stones == 0:
-            return False
-        else:
-            return True
+        return passable(tile, num_stones, optimistic, has_axe, has_key)
 
     def check(self, pos):
-        if self.env[pos] == 'a' and pos not in self.axe:
+        tile = self.env[pos]
+        if tile == 'a' and pos not in self.axe:
             self.axe.add(pos)
-        elif self.env[pos] == 'k' and pos not in self.key:
+        elif tile == 'k' and pos not in self.key:
             self.key.add(pos)
-        elif self.env[pos] == 'o' and pos not in self.stone:
+        elif tile == 'o' and pos not in self.stone:
             self.stone.add(pos)
-        elif self.env[pos] == '$'and self.gold != pos:
+        elif tile == '$'and self.gold != pos:
             self.gold = pos
-        elif self.env[pos] == 'T' and pos not in self.trees:
+            self.landmarks.pin(pos)
+        elif tile == 'T' and pos not in self.trees:
             self.trees.add(pos)
-        elif self.env[pos] == '-' and pos not in self.doors:
+        elif tile == '-' and pos not in self.doors:
             self.doors.add(pos)
 
+    def recheck(self, pos, tile):
+        # pos has changed to tile, so whatever was there may be gone
+        for pois in [self.axe, self.key, self.stone, self.trees, self.doors]:
+            pois.discard(pos) # in case it was picked up or cleared
+        if self.gold == pos and tile != '$':
+            self.gold = None
+        self.check(pos)
+
     def on_poi(self):
         pos = (self.x, self.y)
         curr = self.env[pos]
+        if curr in 'ako$':
+            # picked up, though env only shows it once the agent moves off
+            self.regions.touch(pos)
         if curr == 'a':
             self.axe.remove(pos)
             self.has_axe = True
@@ -484,119 +2661,226 @@ class Agent:
             self.has_gold = True
         elif curr == '~':
             # place stone
-            self.env[pos] = 'O'
+            self.set_tile(pos, 'O')
             self.num_stones -= 1
             # if self.num_stones < 0:
             #     ded
         elif curr == '*' or curr == 'T' or curr == '-':
             raise RuntimeError("I'm inside an obstacle!")
 
+    def fill(self, prior):
+        # take the tiles of a stored map as given, apart from those in view.
+        # They're optimistic: anything that turns out different is corrected
+        # as it comes into view, which is always before the agent gets to it
+        seen = self.seen
+        self.seen = None # these haven't been seen in this game
+        cells = prior.cells
+        for i in range(len(cells)):
+            if cells[i] and cells[i] != 63: # '?'
+                pos = (prior.x0 + i % prior.width, prior.y0 + i // prior.width)
+                if pos not in self.env:
+                    self.learn(pos, TILES[cells[i]])
+        self.seen = seen
+
+    def first_seen(self, pos, tile):
+        # pos has come into view for the first time this game. The stored
+        # map is only as good as the fingerprint of the first view, which
+        # another world could share, so any tile of it that doesn't match
+        # is enough to drop it (see forget)
+        self.seen[pos] = tile
+        if self.prior and self.prior.get(pos, '?') not in ('?', tile):
+            self.contradicted = True
+
+    def forget(self):
+        # the stored map is of some other world: its tiles not seen in this
+        # game go back to unknown, so they're explored like any others and
+        # plan ahead waits until they have been, and it isn't stored again
+        prior = self.prior
+        self.prior = None
+        seen = self.seen
+        self.seen = None # these haven't been seen in this game
+        cells = prior.cells
+        for i in range(len(cells)):
+            if cells[i] and cells[i] != 63: # '?'
+                pos = (prior.x0 + i % prior.width, prior.y0 + i // prior.width)
+                if pos not in seen and self.env.get(pos) == TILES[cells[i]]:
+                    self.set_tile(pos, '?')
+                    self.recheck(pos, '?')
+        self.seen = seen
+        self.plan_ahead = False
+        self.clear_path()
+
+    def learn(self, pos, tile):
+        # a tile known from somewhere other than the view
+        self.set_tile(pos, tile)
+        self.recheck(pos, tile)
+        self.border_n = max(self.border_n, pos[1])
+        self.border_e = max(self.border_e, pos[0])
+        self.border_s = min(self.border_s, pos[1])
+        self.border_w = min(self.border_w, pos[0])
+
+    def join(self, shared, start, direction):
+        # share a map with other agents in the same world, starting at start
+        # in its coordinates (column and row, rows going down) facing
+        # direction (0 to 3 clockwise from up)
+        self.shared = shared
+        self.member = shared.join()
+        self.origin = start
+        self.ahead = [(0, -1), (1, 0), (0, 1), (-1, 0)][direction]
+        self.right = (-self.ahead[1], self.ahead[0])
+        self.outbox = []
+        self.read_from = 0
+
+    def to_world(self, pos):
+        x, y = pos
+        return (self.origin[0] + x * self.right[0] + y * self.ahead[0],
+            self.origin[1] + x * self.right[1] + y * self.ahead[1])
+
+    def from_world(self, pos):
+        c = pos[0] - self.origin[0]
+        r = pos[1] - self.origin[1]
+        return (c * self.right[0] + r * self.right[1], c * self.ahead[0] + r * self.ahead[1])
+
+    def share(self):
+        # publish what has changed in env since last time and take in what
+        # the other agents have seen since, apart from what's in view. The
+        # others can change tiles the path relies on (take the gold it's
+        # heading for, say) without it being checked again, so then it's
+        # dropped to be planned afresh
+        if self.outbox:
+            self.shared.publish(self.member, [self.to_world(pos) + (tile,) for pos, tile in self.outbox])
+        tiles, self.read_from, self.news = self.shared.read(self.member, self.read_from)
+        outbox = self.outbox
+        seen = self.seen
+        self.outbox = None # not news to the others
+        self.seen = None # not seen by this agent
+        stale = False
+        for c, r, tile in tiles:
+            pos = self.from_world((c, r))
+            if abs(pos[0] - self.x) > 2 or abs(pos[1] - self.y) > 2:
+                stale = stale or (pos in self.watched and self.env.get(pos) != tile)
+                self.learn(pos, tile)
+        if stale:
+            self.clear_path()
+        self.seen = seen
+        outbox.clear()
+        self.outbox = outbox
+
+    def finish(self):
+        # at the end of the game: store the map as it was at the start, i.e.
+        # the stored map (if any, and not contradicted) updated with
+        # everything seen this game, and report the profile
+        if self.store and self.map_key:
+            grid = Grid()
+            for source in [self.prior, self.seen]:
+                if source:
+                    cells = source.cells
+                    for i in range(len(cells)):
+                        if cells[i]:
+                            grid[(source.x0 + i % source.width, source.y0 + i // source.width)] = TILES[cells[i]]
+            self.prior = None # done with the file
+            self.store.save(self.map_key, grid)
+        if self.profiler:
+            self.profiler.close()
+        if self.shared:
+            self.shared.claim(self.member, None)
+            self.shared.report(self.member, SharedMap.DONE, False, False, 0)
+
     def update(self, view, action):
-        direction = self.compass.curr()
-        if not self.env: # just spawned
-            self.env = view
-            self.env[(0,0)] = ' '
+        self.see(view, action)
+        if self.shared:
+            self.share()
+
+    def see(self, view, action):
+        first = not self.env
+        moved = False
+        if first: # just spawned
             self.border_n =  2
             self.border_e =  2
             self.border_s = -2
             self.border_w = -2
-            for y in range(2, -3, -1):
-                for x in range(-2, 3):
-                    self.check((x,y))
         elif action == 'f':
-            # add new stuff to env if moved
-            if direction == 'n':
-                self.y += 1
-                curr = self.env[(self.x, self.y)]
-                if curr == '*' or curr == 'T' or curr == '-':
-                    self.y -= 1
-                    return # tried to walk into a wall, nothing happened
-                # top row is new
-                for x in range(-2, 3):
-                    self.env[(self.x + x, self.y + 2)] = view[(x,2)]
-                    self.check((self.x + x, self.y + 2))
-                # update tile you just stepped off
-                self.env[(self.x, self.y - 1)] = view[(0,-1)]
-                if self.y + 2 > self.border_n:
-                    self.border_n = self.y + 2
-                    for x in range(self.border_w, self.border_e + 1):
-                        if (x, self.border_n) not in self.env:
-                            self.env[(x, self.border_n)] = '?'
-            elif direction == 'e':
-                self.x += 1
-                curr = self.env[(self.x, self.y)]
-                if curr == '*' or curr == 'T' or curr == '-':
-                    self.x -= 1
-                    return # tried to walk into a wall, nothing happened
-                # right col is new
-                for x in range(-2, 3):
-                    self.env[(self.x + 2, self.y - x)] = view[(x,2)]
-                    self.check((self.x + 2, self.y - x))
-                # update tile you just stepped off
-                self.env[(self.x - 1, self.y)] = view[(0,-1)]
-                if self.x + 2 > self.border_e:
-                    self.border_e = self.x + 2
-                    for y in range(self.border_s, self.border_n + 1):
-                        if (self.border_e, y) not in self.env:
-                            self.env[(self.border_e, y)] = '?'
-            elif direction == 's':
-                self.y -= 1
-                curr = self.env[(self.x, self.y)]
-                if curr == '*' or curr == 'T' or curr == '-':
-                    self.y += 1
-                    return # tried to walk into a wall, nothing happened
-                # bottom row is new
-                for x in range(-2, 3):
-                    self.env[(self.x - x, self.y - 2)] = view[(x,2)]
-                    self.check((self.x - x, self.y - 2))
-                # update tile you just stepped off
-                self.env[(self.x, self.y + 1)] = view[(0,-1)]
-                if self.y - 2 < self.border_s:
-                    self.border_s = self.y - 2
-                    for x in range(self.border_w, self.border_e + 1):
-                        if (x, self.border_s) not in self.env:
-                            self.env[(x, self.border_s)] = '?'
-            elif direction == 'w':
-                self.x -= 1
-                curr = self.env[(self.x, self.y)]
-                if curr == '*' or curr == 'T' or curr == '-':
-                    self.x += 1
-                    return # tried to walk into a wall, nothing happened
-                # left col is new
-                for x in range(-2, 3):
-                    self.env[(self.x - 2, self.y + x)] = view[(x,2)]
-                    self.check((self.x - 2, self.y + x))
-                # update tile you just stepped off
-                self.env[(self.x + 1, self.y)] = view[(0,-1)]
-                if self.x - 2 < self.border_w:
-                    self.border_w = self.x - 2
-                    for y in range(self.border_s, self.border_n + 1):
-                        if (self.border_w, y) not in self.env:
-                            self.env[(self.border_w, y)] = '?'
-            self.on_poi()
+            dx, dy = AHEAD[self.compass.curr()]
+            curr = self.env[(self.x + dx, self.y + dy)]
+            # nothing happens if it tried to walk into a wall
+            moved = curr != '*' and curr != 'T' and curr != '-'
+            if moved:
+                self.x += dx
+                self.y += dy
         elif action == 'l':
             self.compass.left()
         elif action == 'r':
             self.compass.right()
-        elif action == 'c' or action == 'u':
-            # update right in front since tree or door gone
-            x = None
-            y = None
-            if direction == 'n':
-                x = self.x
-                y = self.y + 1
-            elif direction == 'e':
-                x = self.x + 1
-                y = self.y
-            elif direction == 's':
-                x = self.x
-                y = self.y - 1
-            elif direction == 'w':
-                x = self.x - 1
-                y = self.y
-            self.env[(x, y)] = view[(0,1)]
-            self.trees.discard((x,y))
-            self.doors.discard((x,y))
+        self.ingest(view)
+        if first:
+            self.set_tile((0,0), ' ')
+            if self.store:
+                self.map_key = self.store.key(view)
+                self.prior = self.store.load(self.map_key)
+                if self.prior:
+                    self.fill(self.prior)
+        elif moved:
+            self.on_poi()
+        if self.contradicted and self.prior:
+            self.forget()
+
+    def ingest(self, view):
+        # take in all of the view in one pass, wherever it's facing: each
+        # tile is compared with the byte in env the heading's offsets put it
+        # at, and only those that differ are set and checked, be they new,
+        # just picked up, chopped or unlocked or changed by another agent.
+        # The borders then move out to take in the view, their new cells
+        # becoming '?' (see cover), which still costs in proportion to the
+        # width of the map whenever it crosses one
+        heading = self.compass.curr()
+        offsets = OFFSETS[heading]
+        if isinstance(view, View):
+            frame = view.buffer
+        else:
+            frame = ''.join(map(view.__getitem__, VIEW)).encode('latin-1')
+        x = self.x
+        y = self.y
+        env = self.env
+        env.fit((x + offsets[0][0], y + offsets[0][1]), (x + offsets[-1][0], y + offsets[-1][1]))
+        cells = env.cells
+        steps = self.steps.get((heading, env.width))
+        if steps is None:
+            steps = self.steps[(heading, env.width)] = [dx + dy * env.width for dx, dy in offsets]
+        base = (x - env.x0) + (y - env.y0) * env.width
+        for k, step in enumerate(steps):
+            old = cells[base + step]
+            if old != frame[k]:
+                dx, dy = offsets[k]
+                pos = (x + dx, y + dy)
+                tile = TILES[frame[k]]
+                self.set_tile(pos, tile)
+                if old and old != 63: # '?'
+                    self.recheck(pos, tile)
+                else:
+                    self.check(pos) # seen for the first time
+        seen = self.seen
+        if seen is not None:
+            # as first seen, even where it's no news to env (i.e. matches a
+            # stored map), so the stored map keeps what's since picked up
+            for k, (dx, dy) in enumerate(offsets):
+                pos = (x + dx, y + dy)
+                if frame[k] != 63 and pos not in seen: # '?'
+                    self.first_seen(pos, TILES[frame[k]])
+
+        n, e, s, w = self.border_n, self.border_e, self.border_s, self.border_w
+        if y + 2 > n or x + 2 > e or y - 2 < s or x - 2 < w:
+            self.border_n = max(n, y + 2)
+            self.border_e = max(e, x + 2)
+            self.border_s = min(s, y - 2)
+            self.border_w = min(w, x - 2)
+            if self.border_n > n:
+                self.cover(self.border_w, n + 1, self.border_e, self.border_n)
+            if self.border_s < s:
+                self.cover(self.border_w, self.border_s, self.border_e, s - 1)
+            if self.border_e > e:
+                self.cover(e + 1, s, self.border_e, n)
+            if self.border_w < w:
+                self.cover(self.border_w, s, w - 1, n)
 
     def show(self):
         line = '+'
@@ -654,31 +2938,228 @@ def print_view(view):
         print(line)
     print("+-----+")
 
-if len(sys.argv) < 3:
-    print("Usage: %s -p <port>" % sys.argv[0])
-    sys.exit()
+FRAME = 24 # bytes per view sent by the engine
+VIEW = [(x, y) for y in range(2, -3, -1) for x in range(-2, 3) if not (x == 0 and y == 0)] # order sent
+VIEW_INDEX = {pos: i for i, pos in enumerate(VIEW)}
+AHEAD = {'n': (0, 1), 'e': (1, 0), 's': (0, -1), 'w': (-1, 0)} # a step forward by heading
+# where each tile of the view is relative to the agent by heading, the view
+# being turned so the agent faces its far row
+OFFSETS = {d: [(x * b + y * a, y * b - x * a) for x, y in VIEW] for d, (a, b) in AHEAD.items()}
 
-# open socket to Game Engine
-sd = socket.create_connection(('localhost', sys.argv[2]))
-in_stream = sd.makefile('r')
-out_stream = sd.makefile('w')
+class View:
+    # read-only stand-in for the view dict, looking tiles up straight from
+    # the frame buffer instead of copying them out, so it's only good until
+    # the next frame is read into the buffer
+    __slots__ = ['buffer']
 
-action = ''
-agent = Agent()
+    def __init__(self, buffer):
+        self.buffer = buffer
 
-while True:
-    # scan 5-by-5 window around curr loc
-    view = {}
-    for y in range(2, -3, -1):
-        for x in range(-2, 3):
-            if not (x == 0 and y == 0): # skip agent location
-                ch = in_stream.read(1) # read 1 char at a time
-                if ch == -1:
-                    exit()
-                view[(x, y)] = ch
-    # print_view(view)
-    agent.update(view, action)
-    # agent.show()
-    action = agent.get_action()
-    out_stream.write(action)
-    out_stream.flush()
+    def __getitem__(self, pos):
+        return TILES[self.buffer[VIEW_INDEX[pos]]]
+
+    def __contains__(self, pos):
+        return pos in VIEW_INDEX
+
+    def __iter__(self):
+        return iter(VIEW)
+
+    def __len__(self):
+        return FRAME
+
+class Recorder:
+    # Append-only log of games against the engine, switched on by setting
+    # AGENT_RECORD (or -R) to a file, for replaying them offline with
+    # replay.py. Each game is a header followed by a record per move: the
+    # frame as sent, the action sent back and how long the agent took over
+    # it in microseconds. Writes go through a large buffer, so recording a
+    # move is just a copy into it until it fills or the game is over.
+    # A frame is only ever tiles, so it can't be mistaken for a header
+    HEADER = struct.Struct('<4sBxxxd') # magic, version, time the game started
+    RECORD = struct.Struct('<%dscI' % FRAME) # frame, action, microseconds
+    MAGIC = b'AREC'
+    VERSION = 1
+    BUFFER = 1 << 16 # bytes
+
+    def __init__(self, path):
+        self.file = open(path, 'ab', buffering = self.BUFFER)
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION, time.time()))
+
+    def record(self, frame, action, seconds):
+        self.file.write(self.RECORD.pack(bytes(frame), action.encode(), min(int(seconds * 1e6), 0xffffffff)))
+
+    def close(self):
+        self.file.close()
+
+    @classmethod
+    def load(cls, path):
+        # the games in a recording as (start time, moves) with a move being
+        # (frame, action, seconds). A game cut short mid-record (the agent
+        # was killed) ends at the last whole one
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data and not data.startswith(cls.MAGIC):
+            raise ValueError('%s is not a recording' % path)
+        games = []
+        i = 0
+        while data.startswith(cls.MAGIC, i) and i + cls.HEADER.size <= len(data):
+            _, version, started = cls.HEADER.unpack_from(data, i)
+            if version != cls.VERSION:
+                raise ValueError('%s is recorded in version %d' % (path, version))
+            i += cls.HEADER.size
+            moves = []
+            while i + cls.RECORD.size <= len(data) and not data.startswith(cls.MAGIC, i):
+                frame, action, micros = cls.RECORD.unpack_from(data, i)
+                moves.append((frame, action.decode(), micros / 1e6))
+                i += cls.RECORD.size
+            games.append((started, moves))
+        return games
+
+class Client:
+    # connection to the game engine, which sends a frame for every action
+    # until the game is over and then hangs up
+    def __init__(self, port, host = 'localhost'):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # actions are single bytes
+        self.buffer = bytearray(FRAME)
+        self.frame = memoryview(self.buffer)
+        self.view = View(self.buffer)
+
+    def read(self):
+        # read the next frame into the buffer, returning False at the end
+        got = 0
+        while got < FRAME:
+            n = self.sock.recv_into(self.frame[got:])
+            if n == 0:
+                return False # engine hung up
+            got += n
+        return True
+
+    def send(self, action):
+        self.sock.sendall(action.encode())
+
+    def run(self, agent):
+        recorder = Recorder(RECORD) if RECORD else None
+        action = ''
+        try:
+            while self.read():
+                start = time.perf_counter()
+                # print_view(self.view)
+                agent.update(self.view, action)
+                # agent.show()
+                action = agent.get_action()
+                if recorder:
+                    recorder.record(self.buffer, action, time.perf_counter() - start)
+                self.send(action)
+        except ConnectionError:
+            pass # engine hung up mid-frame or before taking the action
+        finally:
+            self.sock.close()
+            agent.finish()
+            if recorder:
+                recorder.close()
+
+class AsyncClient:
+    # connection to the game engine that gives the agent a time budget per
+    # move, covering all it does with the frame: taking it in, working out
+    # its safe moves and deciding. That all happens in a worker thread, and
+    # if it's still going when the budget runs out one of the safe moves is
+    # sent instead, or a turn on the spot if they weren't ready or there are
+    # none left. It's left to finish in the background, and then catches up
+    # on the frames it missed and carries on from where it actually is,
+    # keeping whatever plan it came up with
+    def __init__(self, agent, budget = 0.5):
+        self.agent = agent
+        self.budget = budget
+        self.late = 0 # moves made without the agent's decision
+
+    def prepare(self, missed, frame, action, overruled):
+        # run in the worker, so the agent is only ever used by one thread
+        for old_frame, old_action in missed:
+            self.agent.update(View(old_frame), old_action)
+        self.agent.update(View(frame), action)
+        if overruled:
+            self.agent.resync()
+        return self.agent.safe_moves()
+
+    def think(self, missed, frame, action, overruled, ready):
+        # prepare, handing the safe moves to the event loop through ready as
+        # soon as they're known, then decide
+        safe = self.prepare(missed, frame, action, overruled)
+        ready.get_loop().call_soon_threadsafe(ready.set_result, safe)
+        return self.agent.get_action()
+
+    async def run(self, port, host = 'localhost'):
+        loop = asyncio.get_running_loop()
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        worker = ThreadPoolExecutor(1)
+        thinking = None # think still going after its budget ran out
+        missed = [] # frames and the actions that led to them since then
+        overruled = False # whether the agent's last decision wasn't used
+        safe = []
+        action = ''
+        recorder = Recorder(RECORD) if RECORD else None
+        try:
+            while True:
+                try:
+                    frame = await reader.readexactly(FRAME)
+                except asyncio.IncompleteReadError:
+                    break # engine hung up
+                start = loop.time()
+                deadline = start + self.budget
+                if thinking and thinking.done():
+                    thinking.result() # too late to use, but raise any error
+                    thinking = None
+                if thinking:
+                    # still busy so keep going without it
+                    missed.append((frame, action))
+                    action = safe.pop(0) if safe else 'l'
+                    self.late += 1
+                else:
+                    ready = loop.create_future()
+                    thinking = loop.run_in_executor(worker, self.think, missed, frame, action, overruled, ready)
+                    missed = []
+                    overruled = False
+                    try:
+                        action = await asyncio.wait_for(asyncio.shield(thinking),
+                            max(0, deadline - loop.time()))
+                        thinking = None
+                    except asyncio.TimeoutError:
+                        # safe moves that turn up later start from before
+                        # this move, so they're no use then
+                        safe = ready.result() if ready.done() else []
+                        action = safe.pop(0) if safe else 'l'
+                        overruled = True
+                        self.late += 1
+                if recorder:
+                    recorder.record(frame, action, loop.time() - start)
+                writer.write(action.encode())
+                await writer.drain()
+        except ConnectionError:
+            pass # engine hung up before taking the action
+        finally:
+            writer.close()
+            worker.submit(self.agent.finish) # after any late decision
+            worker.shutdown(wait = False)
+            if recorder:
+                recorder.close()
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print("Usage: %s -p <port> [-b <seconds per move>] [-P table|<file>] [-M <map directory>] [-R <recording>]" % sys.argv[0])
+        sys.exit()
+
+    if '-P' in sys.argv:
+        PROFILE = sys.argv[sys.argv.index('-P') + 1]
+    if '-M' in sys.argv:
+        MAPS = sys.argv[sys.argv.index('-M') + 1]
+    if '-R' in sys.argv:
+        RECORD = sys.argv[sys.argv.index('-R') + 1]
+
+    # open socket to Game Engine
+    if '-b' in sys.argv:
+        budget = float(sys.argv[sys.argv.index('-b') + 1])
+        asyncio.run(AsyncClient(Agent(), budget).run(int(sys.argv[2])))
+    else:
+        Client(int(sys.argv[2])).run(Agent())
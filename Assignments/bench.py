@@ -0,0 +1,127 @@
+#!/usr/bin/python
+
+# bench.py
+# Benchmarks the agent in "ass2 agent.py" on the simulator in sim.py
+# For each map it reports the result, the moves taken, the total decision
+# time, the mean, median and 99th percentile time per decision and the peak
+# memory allocated during the game. The corpus is every map in maps/ plus
+# generated maps of increasing size for checking how the agent scales.
+# With -a it instead compares the nodes the agent's A* searches expand (as
+# counted by its Profiler) with the landmark estimates turned off and on.
+
+import sys, os, glob, time, tracemalloc
+import sim
+
+MAPS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maps')
+SIZES = [40, 80, 120, 160] # generated maps, square
+SEEDS = 2 # generated maps per size
+
+def percentile(times, p):
+    times = sorted(times)
+    return times[min(len(times) - 1, int(len(times) * p / 100))]
+
+def run(module, name, text, limit, memory):
+    game = sim.Game(text)
+    agent = module.Agent()
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    times = sim.play(agent, game, limit)
+    total = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return summary(name, game.result or 'out of moves', game.moves, times, total, peak)
+
+def expansions(module, name, text, limit, landmarks):
+    # (result, moves, nodes expanded, time) for a game with that many
+    # anchors per state (see Landmarks)
+    saved = module.LANDMARKS
+    module.LANDMARKS = landmarks
+    try:
+        game = sim.Game(text)
+        agent = module.Agent()
+        profiler = module.Profiler(os.devnull)
+        profiler.install(agent)
+        start = time.perf_counter()
+        sim.play(agent, game, limit)
+        total = time.perf_counter() - start
+    finally:
+        module.LANDMARKS = saved
+    return game.result or 'out of moves', game.moves, profiler.total_counts['expanded'], total
+
+def compare(module, maps, limit):
+    print('%-16s %-18s %6s %10s %10s %7s %9s %9s' % ('map', 'result', 'moves', 'before', 'after', 'change', 'before(s)', 'after(s)'))
+    totals = [0, 0, 0.0, 0.0]
+    for name, text in maps:
+        result, moves, before, spent = expansions(module, name, text, limit, 0)
+        _, _, after, taken = expansions(module, name, text, limit, module.LANDMARKS)
+        print('%-16s %-18s %6d %10d %10d %6.1f%% %9.3f %9.3f' % (name, result, moves, before, after,
+            100.0 * (after - before) / max(before, 1), spent, taken))
+        for k, value in enumerate([before, after, spent, taken]):
+            totals[k] += value
+    print('nodes expanded %d before, %d after (%.1f%%), %.3fs before, %.3fs after' % (totals[0], totals[1],
+        100.0 * (totals[1] - totals[0]) / max(totals[0], 1), totals[2], totals[3]))
+
+def summary(name, result, moves, times, total, peak = None):
+    times = times or [0.0]
+    return {
+        'map': name,
+        'result': result,
+        'moves': moves,
+        'time': total,
+        'mean': sum(times) / len(times),
+        'p50': percentile(times, 50),
+        'p99': percentile(times, 99),
+        'peak': peak,
+    }
+
+def corpus(sizes = SIZES, seeds = SEEDS):
+    # (name, text) for every map to be run
+    maps = []
+    for path in sorted(glob.glob(os.path.join(MAPS, '*.in'))):
+        maps.append((os.path.basename(path), sim.load_map(path)))
+    for size in sizes:
+        for seed in range(seeds):
+            name = 'gen%dx%d-%d' % (size, size, seed)
+            maps.append((name, sim.generate(size, size, seed, water = 0.05, stones = 3)))
+    return maps
+
+def report(results):
+    print('%-16s %-18s %6s %9s %9s %9s %9s %9s' % ('map', 'result', 'moves', 'time(s)', 'mean(ms)', 'p50(ms)', 'p99(ms)', 'peak(KiB)'))
+    for r in results:
+        peak = '-' if r['peak'] is None else str(r['peak'] // 1024)
+        print('%-16s %-18s %6d %9.3f %9.3f %9.3f %9.3f %9s' % (r['map'], r['result'], r['moves'], r['time'],
+            r['mean'] * 1000, r['p50'] * 1000, r['p99'] * 1000, peak))
+    won = sum(1 for r in results if r['result'] == 'won')
+    print('won %d/%d, %d moves, %.3fs' % (won, len(results), sum(r['moves'] for r in results), sum(r['time'] for r in results)))
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if '-h' in args:
+        print("Usage: %s [-m] [-a] [-l <limit>] [<map>...]" % sys.argv[0])
+        print("  -m  measure peak memory (slows the agent down)")
+        print("  -a  compare A* nodes expanded without landmarks and with")
+        sys.exit()
+    memory = '-m' in args
+    if memory:
+        args.remove('-m')
+    alt = '-a' in args
+    if alt:
+        args.remove('-a')
+    limit = 20000
+    if '-l' in args:
+        i = args.index('-l')
+        limit = int(args[i + 1])
+        del args[i:i + 2]
+
+    module = sim.load_agent()
+    if args:
+        maps = [(os.path.basename(path), sim.load_map(path)) for path in args]
+    else:
+        maps = corpus()
+    if alt:
+        compare(module, maps, limit)
+    else:
+        report([run(module, name, text, limit, memory) for name, text in maps])
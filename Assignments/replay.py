@@ -0,0 +1,92 @@
+#!/usr/bin/python
+
+# replay.py
+# Replays games recorded by the agent in "ass2 agent.py" (see Recorder) with
+# no engine or socket: every recorded frame is fed back through
+# Agent.update/get_action as fast as it will go, along with the action that
+# was actually sent before it, so the agent sees exactly the game it played.
+# For each game it reports the moves, how many decisions came out different
+# from the recorded ones (the agent is deterministic apart from its time
+# budgets, and a game played with -b has moves the agent didn't choose), the
+# total, mean, median and 99th percentile time per decision in the recording
+# and in the replay, and the frames that slowed down the most, so a recording
+# can be kept as a performance regression case.
+
+import sys, time
+import sim, bench
+
+def replay(module, moves):
+    # (seconds per decision, frames where the decision differed)
+    agent = module.Agent()
+    buffer = bytearray(module.FRAME)
+    view = module.View(buffer)
+    times = []
+    differed = []
+    action = ''
+    overruled = False
+    for i, (frame, recorded, _) in enumerate(moves):
+        buffer[:] = frame
+        start = time.perf_counter()
+        agent.update(view, action)
+        if overruled:
+            agent.resync() # as AsyncClient does after sending something else
+        chosen = agent.get_action()
+        times.append(time.perf_counter() - start)
+        overruled = chosen != recorded
+        if overruled:
+            differed.append(i)
+        action = recorded
+    agent.finish()
+    return times, differed
+
+def report(name, moves, times, differed, worst, every):
+    recorded = [seconds for _, _, seconds in moves] or [0.0]
+    times = times or [0.0]
+    print('%s: %d moves, %d decisions differ%s' % (name, len(moves), len(differed),
+        ' (first at frame %d)' % differed[0] if differed else ''))
+    print('  %-9s %9s %9s %9s %9s' % ('', 'time(s)', 'mean(ms)', 'p50(ms)', 'p99(ms)'))
+    for label, t in [('recorded', recorded), ('replayed', times)]:
+        print('  %-9s %9.3f %9.3f %9.3f %9.3f' % (label, sum(t), sum(t) / len(t) * 1000,
+            bench.percentile(t, 50) * 1000, bench.percentile(t, 99) * 1000))
+    if every:
+        frames = range(len(moves))
+    else:
+        slower = [i for i in range(len(moves)) if times[i] > recorded[i]]
+        frames = sorted(slower, key = lambda i: times[i] - recorded[i], reverse = True)[:worst]
+    if frames:
+        print('  %6s %6s %12s %12s' % ('frame', 'action', 'recorded(ms)', 'replayed(ms)'))
+    for i in frames:
+        print('  %6d %6s %12.3f %12.3f' % (i, moves[i][1], recorded[i] * 1000, times[i] * 1000))
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if not args or '-h' in args:
+        print("Usage: %s [-g <game>] [-w <frames>] [-f] <recording>..." % sys.argv[0])
+        print("  -g  replay only this game of each recording, counting from 0")
+        print("  -w  frames to list that slowed down the most (default 5)")
+        print("  -f  list the timing of every frame")
+        sys.exit()
+
+    def option(flag, default):
+        if flag in args:
+            i = args.index(flag)
+            value = int(args[i + 1])
+            del args[i:i + 2]
+            return value
+        return default
+
+    only = option('-g', None)
+    worst = option('-w', 5)
+    every = '-f' in args
+    if every:
+        args.remove('-f')
+
+    module = sim.load_agent()
+    for path in args:
+        games = module.Recorder.load(path)
+        for n, (started, moves) in enumerate(games):
+            if only is not None and n != only:
+                continue
+            times, differed = replay(module, moves)
+            name = '%s game %d (%s)' % (path, n, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started)))
+            report(name, moves, times, differed, worst, every)
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+
+# runner.py
+# Plays many games of the agent in "ass2 agent.py" at once, one Agent per
+# game, spread over a pool of worker processes so it scales with the cores
+# available.
+# Games are either played on the simulator in sim.py, over maps given on the
+# command line and/or generated ones, or against game engines already
+# listening on local ports, one game per port. The results of every game are
+# reported as by bench.py, along with the overall throughput in games per
+# second.
+
+import sys, os, time, tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import sim, bench
+
+module = None # the agent, loaded once per worker
+
+def init():
+    global module
+    module = sim.load_agent()
+
+def play_map(name, text, limit, memory):
+    return bench.run(module, name, text, limit, memory)
+
+def play_port(port, limit, memory):
+    # the engine knows how the game ended but doesn't say, so a game that
+    # runs until it hangs up is only known to have finished
+    agent = module.Agent()
+    client = module.Client(port)
+    if memory:
+        tracemalloc.start()
+    times = []
+    action = ''
+    start = time.perf_counter()
+    try:
+        while len(times) < limit and client.read():
+            tick = time.perf_counter()
+            agent.update(client.view, action)
+            action = agent.get_action()
+            times.append(time.perf_counter() - tick)
+            client.send(action)
+        result = 'finished' if len(times) < limit else 'out of moves'
+    except ConnectionError:
+        result = 'finished'
+    finally:
+        client.sock.close()
+        agent.finish()
+    total = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return bench.summary('port %d' % port, result, len(times), times, total, peak)
+
+def play(game):
+    # run in a worker, so a crash only loses the one game
+    kind, args = game
+    try:
+        if kind == 'map':
+            return play_map(*args)
+        return play_port(*args)
+    except Exception as e:
+        name = args[0] if kind == 'map' else 'port %d' % args[0]
+        return bench.summary(name, 'crashed (%s)' % type(e).__name__, 0, [], 0.0)
+
+def run(games, workers = None):
+    # play the games, returning their results in order and the wall time
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer = init) as pool:
+        results = list(pool.map(play, games))
+    return results, time.perf_counter() - start
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if not args or '-h' in args:
+        print("Usage: %s [-j <workers>] [-l <limit>] [-m] [-g <games>] [-s <size>] [-p <port>...] [<map>...]" % sys.argv[0])
+        print("  -j  worker processes (default one per core)")
+        print("  -g  games on generated maps, seeded 0 to games - 1")
+        print("  -s  size of the generated maps (default 40)")
+        print("  -p  ports of local game engines, one game each")
+        print("  -m  measure peak memory (slows the agent down)")
+        sys.exit()
+
+    def option(flag, default):
+        if flag in args:
+            i = args.index(flag)
+            value = int(args[i + 1])
+            del args[i:i + 2]
+            return value
+        return default
+
+    workers = option('-j', None)
+    limit = option('-l', 20000)
+    count = option('-g', 0)
+    size = option('-s', 40)
+    memory = '-m' in args
+    if memory:
+        args.remove('-m')
+    ports = []
+    if '-p' in args:
+        i = args.index('-p')
+        j = i + 1
+        while j < len(args) and args[j].isdigit():
+            ports.append(int(args[j]))
+            j += 1
+        del args[i:j]
+
+    games = [('map', (os.path.basename(path), sim.load_map(path), limit, memory)) for path in args]
+    for seed in range(count):
+        text = sim.generate(size, size, seed, water = 0.05, stones = 3)
+        games.append(('map', ('gen%dx%d-%d' % (size, size, seed), text, limit, memory)))
+    games += [('port', (port, limit, memory)) for port in ports]
+
+    results, wall = run(games, workers)
+    bench.report(results)
+    print('%d games in %.3fs wall, %.2f games/s with %d workers' % (len(games), wall,
+        len(games) / wall, workers or os.cpu_count()))
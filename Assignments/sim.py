@@ -0,0 +1,278 @@
+#!/usr/bin/python
+
+# sim.py
+# Headless game engine for the agent in "ass2 agent.py"
+# Plays games in-process so the agent can be tested and benchmarked without
+# the Java game server.
+
+# Maps use the same text format as the game engine: one row per line, with
+# ' ' land, '*' wall, 'T' tree, '-' door, '~' water, 'a' axe, 'k' key,
+# 'o' stepping stone, 'O' placed stone, '$' gold and '.' for the edge of the
+# world, and the agent's starting position and direction marked by one of
+# '^', '>', 'v' or '<'. Anything outside the map is seen as '.'.
+
+# The rules follow the engine: the agent sees the 5x5 window around itself
+# (minus its own tile) rotated so it is facing up, sent as 24 characters
+# row by row from the far row to the near one. 'l' and 'r' turn, 'c' chops
+# down a tree in front if it has the axe and 'u' unlocks a door in front if
+# it has the key. 'f' moves forward unless a wall, tree or door is in the
+# way, picking up whatever is there. Walking into water places a stone if it
+# has one and drowns it otherwise, and walking off the edge of the world
+# loses too. It wins by getting back to where it started with the gold.
+
+import sys, os, time, random, importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+DIRECTIONS = ['^', '>', 'v', '<'] # clockwise from north
+STEPS = {'^': (0, -1), '>': (1, 0), 'v': (0, 1), '<': (-1, 0)} # column, row
+
+AGENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ass2 agent.py')
+
+def load_agent(path = AGENT):
+    # import the agent as a module, its file name not being importable
+    spec = importlib.util.spec_from_file_location('agent', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def load_map(path):
+    with open(path) as f:
+        return f.read()
+
+class Game:
+    def __init__(self, text):
+        rows = text.replace('\r', '').rstrip('\n').split('\n')
+        width = max(len(row) for row in rows)
+        self.rows = [list(row.ljust(width)) for row in rows]
+        self.start = None
+        for r, row in enumerate(self.rows):
+            for c, tile in enumerate(row):
+                if tile in STEPS:
+                    self.start = (c, r)
+                    self.direction = DIRECTIONS.index(tile)
+                    row[c] = ' '
+        if self.start is None:
+            raise ValueError('map has no agent')
+        self.pos = self.start
+
+        self.has_axe = False
+        self.has_key = False
+        self.num_stones = 0
+        self.has_gold = False
+
+        self.moves = 0
+        self.result = None # 'won' or how it was lost once over
+
+    def tile(self, c, r):
+        if 0 <= r < len(self.rows) and 0 <= c < len(self.rows[r]):
+            return self.rows[r][c]
+        return '.'
+
+    def view(self):
+        # 24 characters as sent by the engine
+        dc, dr = STEPS[DIRECTIONS[self.direction]]
+        c, r = self.pos
+        view = []
+        for ahead in range(2, -3, -1):
+            for right in range(-2, 3):
+                if not (ahead == 0 and right == 0): # skip agent location
+                    view.append(self.tile(c + dc * ahead - dr * right, r + dr * ahead + dc * right))
+        return ''.join(view)
+
+    def step(self, action):
+        self.moves += 1
+        action = action.lower()
+        dc, dr = STEPS[DIRECTIONS[self.direction]]
+        c = self.pos[0] + dc
+        r = self.pos[1] + dr
+        ahead = self.tile(c, r)
+        if action == 'l':
+            self.direction = (self.direction - 1) % 4
+        elif action == 'r':
+            self.direction = (self.direction + 1) % 4
+        elif action == 'c':
+            if ahead == 'T' and self.has_axe:
+                self.rows[r][c] = ' '
+        elif action == 'u':
+            if ahead == '-' and self.has_key:
+                self.rows[r][c] = ' '
+        elif action == 'f':
+            if ahead in '*T-':
+                return # blocked, nothing happens
+            elif ahead == '.':
+                self.result = 'fell off the world'
+                return
+            elif ahead == '~':
+                if not self.num_stones:
+                    self.result = 'drowned'
+                    return
+                self.num_stones -= 1
+                self.rows[r][c] = 'O'
+            elif ahead == 'a':
+                self.has_axe = True
+                self.rows[r][c] = ' '
+            elif ahead == 'k':
+                self.has_key = True
+                self.rows[r][c] = ' '
+            elif ahead == 'o':
+                self.num_stones += 1
+                self.rows[r][c] = ' '
+            elif ahead == '$':
+                self.has_gold = True
+                self.rows[r][c] = ' '
+            self.pos = (c, r)
+            if self.has_gold and self.pos == self.start:
+                self.result = 'won'
+
+def view_dict(frame):
+    # the view as the dict Agent.update expects
+    view = {}
+    i = 0
+    for y in range(2, -3, -1):
+        for x in range(-2, 3):
+            if not (x == 0 and y == 0): # skip agent location
+                view[(x, y)] = frame[i]
+                i += 1
+    return view
+
+def play(agent, game, limit = 10000, show = False):
+    # play a game to the end (or limit moves), returning the time each
+    # decision took in seconds
+    times = []
+    action = ''
+    while game.result is None and game.moves < limit:
+        view = view_dict(game.view())
+        start = time.perf_counter()
+        agent.update(view, action)
+        action = agent.get_action()
+        times.append(time.perf_counter() - start)
+        if show:
+            agent.show()
+            print(action)
+        game.step(action)
+    if hasattr(agent, 'finish'):
+        agent.finish() # game over
+    return times
+
+def team(text, count, seed = 0):
+    # games for count agents in the one world: the first starts where the
+    # map says and the others on land chosen at random, facing any way.
+    # They share the world's tiles, so what one picks up is gone for all,
+    # but not each other's tools, and they don't get in each other's way
+    games = [Game(text) for _ in range(count)]
+    rand = random.Random(seed)
+    land = [(c, r) for r, row in enumerate(games[0].rows) for c, tile in enumerate(row) if tile == ' ']
+    for game in games[1:]:
+        game.rows = games[0].rows
+        game.start = game.pos = rand.choice(land)
+        game.direction = rand.randrange(4)
+    return games
+
+def play_team(module, games, limit = 10000):
+    # play the games of a team to the end (or limit rounds) with an agent
+    # each, all sharing a map and deciding at the same time in threads,
+    # the moves then being made in turn. An agent that gives up (no action)
+    # plays no more. Returns the rounds played and the time each decision
+    # took in seconds; the team wins when any agent does
+    shared = module.SharedMap()
+    agents = [module.Agent() for _ in games]
+    for agent, game in zip(agents, games):
+        agent.join(shared, game.start, game.direction)
+    actions = [''] * len(games)
+    times = []
+
+    def decide(i):
+        start = time.perf_counter()
+        agents[i].update(view_dict(games[i].view()), actions[i])
+        actions[i] = agents[i].get_action()
+        times.append(time.perf_counter() - start)
+
+    rounds = 0
+    with ThreadPoolExecutor(len(games)) as pool:
+        while rounds < limit and all(game.result != 'won' for game in games):
+            playing = [i for i, game in enumerate(games) if game.result is None and actions[i] is not None]
+            if not playing:
+                break
+            for future in [pool.submit(decide, i) for i in playing]:
+                future.result()
+            for i in playing:
+                if actions[i] is None:
+                    continue # given up
+                games[i].step(actions[i])
+                if games[i].result:
+                    agents[i].finish()
+            rounds += 1
+    for agent, game in zip(agents, games):
+        if game.result is None:
+            agent.finish()
+    shared.close()
+    shared.unlink()
+    return rounds, times
+
+def generate(width, height, seed = 0, walls = 0.2, trees = 0.03, water = 0.0, stones = 0):
+    # random map with an axe, a key, some stones and a winding but clear way
+    # from the start to the gold, surrounded by walls
+    rand = random.Random(seed)
+    rows = [['*'] * width for _ in range(height)]
+    for r in range(1, height - 1):
+        for c in range(1, width - 1):
+            roll = rand.random()
+            if roll < walls:
+                rows[r][c] = '*'
+            elif roll < walls + trees:
+                rows[r][c] = 'T'
+            elif roll < walls + trees + water:
+                rows[r][c] = '~'
+            else:
+                rows[r][c] = ' '
+    start = (rand.randrange(1, width - 1), rand.randrange(1, height - 1))
+    gold = (rand.randrange(1, width - 1), rand.randrange(1, height - 1))
+    c, r = start
+    while (c, r) != gold:
+        if c != gold[0] and (r == gold[1] or rand.random() < 0.5):
+            c += 1 if gold[0] > c else -1
+        else:
+            r += 1 if gold[1] > r else -1
+        if rows[r][c] in '*~T':
+            rows[r][c] = ' '
+    rows[start[1]][start[0]] = '^'
+    rows[gold[1]][gold[0]] = '$'
+    land = [(c, r) for r in range(height) for c in range(width) if rows[r][c] == ' ']
+    for tile in 'ak' + 'o' * stones:
+        c, r = rand.choice(land)
+        rows[r][c] = tile
+    return '\n'.join(''.join(row) for row in rows) + '\n'
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: %s [-v] [-l <limit>] [-n <agents>] <map>..." % sys.argv[0])
+        print("  -n  agents sharing a map in each world (see play_team)")
+        sys.exit()
+
+    args = sys.argv[1:]
+    show = '-v' in args
+    if show:
+        args.remove('-v')
+    limit = 10000
+    if '-l' in args:
+        i = args.index('-l')
+        limit = int(args[i + 1])
+        del args[i:i + 2]
+    count = 1
+    if '-n' in args:
+        i = args.index('-n')
+        count = int(args[i + 1])
+        del args[i:i + 2]
+
+    module = load_agent()
+    for path in args:
+        if count > 1:
+            games = team(load_map(path), count)
+            rounds, times = play_team(module, games, limit)
+            result = 'won' if any(game.result == 'won' for game in games) else 'not won'
+            print('%s: %s by %d agents in %d rounds (%s) (%.3fs)' % (path, result, count, rounds,
+                ', '.join(game.result or 'playing' for game in games), sum(times)))
+            continue
+        game = Game(load_map(path))
+        times = play(module.Agent(), game, limit, show)
+        print('%s: %s in %d moves (%.3fs)' % (path, game.result or 'out of moves', game.moves, sum(times)))
@@ -0,0 +1,365 @@
+#!/usr/bin/python
+
+# test_agent.py
+# Regression tests for the agent in "ass2 agent.py", played on the simulator
+# in sim.py. Run with: python -m unittest test_agent (or pytest)
+
+import os, random, tempfile, threading, unittest
+from collections import deque
+import sim
+
+agent = sim.load_agent()
+
+def random_map(player, rand, width, height, walls, special):
+    # fill player's map with a width by height block of random tiles, home
+    # (0,0) in a corner being land so it can be a landmark
+    for y in range(height):
+        for x in range(width):
+            roll = rand.random()
+            if roll < walls:
+                tile = '*'
+            elif roll < walls + special:
+                tile = rand.choice('~T-oak?')
+            else:
+                tile = ' '
+            player.set_tile((x, y), tile)
+    player.set_tile((0,0), ' ')
+
+def distance(env, start, target, state):
+    # moves from start to target by plain breadth-first search under state
+    # (num_stones, optimistic, has_axe, has_key), or None if there's no way
+    seen = {start: 0}
+    queue = deque([start])
+    while queue:
+        pos = queue.popleft()
+        if pos == target:
+            return seen[pos]
+        x, y = pos
+        for n in [(x, y + 1), (x + 1, y), (x, y - 1), (x - 1, y)]:
+            if n not in seen and n in env and agent.passable(env[n], *state):
+                seen[n] = seen[pos] + 1
+                queue.append(n)
+    return None
+
+def check_path(test, env, path, start, target, state, moves):
+    # path is a shortest way from start to target, or [] if there's none
+    if moves is None:
+        test.assertEqual(path, [])
+        return
+    test.assertEqual(len(path) - 1, moves)
+    test.assertEqual(path[0], start)
+    test.assertEqual(path[-1], target)
+    for a, b in zip(path, path[1:]):
+        test.assertEqual(abs(a[0] - b[0]) + abs(a[1] - b[1]), 1)
+        test.assertTrue(agent.passable(env[b], *state))
+
+class GenerateTest(unittest.TestCase):
+    # generated maps have a way from the start to the gold needing no tools
+    def test_way_to_gold_clear(self):
+        for seed in range(50):
+            rows = sim.generate(30, 30, seed, trees = 0.2, water = 0.1).split('\n')
+            start = next((c, r) for r, row in enumerate(rows) for c, tile in enumerate(row) if tile == '^')
+            seen = {start}
+            queue = deque([start])
+            while queue:
+                c, r = queue.popleft()
+                if rows[r][c] == '$':
+                    break
+                for n in [(c + 1, r), (c - 1, r), (c, r + 1), (c, r - 1)]:
+                    if n not in seen and rows[n[1]][n[0]] not in '*~T-':
+                        seen.add(n)
+                        queue.append(n)
+            else:
+                self.fail('no clear way to the gold on seed %d' % seed)
+
+class WarmStartTest(unittest.TestCase):
+    # maps stored by earlier games (see MapStore) are kept as they were at
+    # the start, so every game after the first starts knowing the gold
+    def setUp(self):
+        self.maps = agent.MAPS
+        agent.MAPS = tempfile.mkdtemp()
+
+    def tearDown(self):
+        agent.MAPS = self.maps
+
+    def test_games_in_a_row(self):
+        text = sim.generate(60, 60, 3)
+        moves = []
+        for _ in range(3):
+            game = sim.Game(text)
+            sim.play(agent.Agent(), game, 20000)
+            self.assertEqual(game.result, 'won')
+            moves.append(game.moves)
+        self.assertLessEqual(moves[2], moves[1])
+        # and the gold is known from the first view
+        player = agent.Agent()
+        player.update(sim.view_dict(sim.Game(text).view()), '')
+        self.assertTrue(player.gold)
+        player.finish()
+
+def splice(a, b):
+    # the map b, but with the 5x5 around its start taken from around a's,
+    # so games on the two start with the same view
+    a = [list(row) for row in a.split('\n')]
+    b = [list(row) for row in b.split('\n')]
+    ac, ar = next((c, r) for r, row in enumerate(a) for c, tile in enumerate(row) if tile == '^')
+    bc, br = next((c, r) for r, row in enumerate(b) for c, tile in enumerate(row) if tile == '^')
+    for dr in range(-2, 3):
+        for dc in range(-2, 3):
+            if 0 < br + dr < len(b) - 2 and 0 < bc + dc < len(b[0]) - 1:
+                b[br + dr][bc + dc] = a[ar + dr][ac + dc]
+    return '\n'.join(''.join(row) for row in b)
+
+class SameStartTest(unittest.TestCase):
+    # a world starting with the same view as a stored one but different
+    # elsewhere is still won, and doesn't spoil the stored map for either
+    def setUp(self):
+        self.maps = agent.MAPS
+        agent.MAPS = tempfile.mkdtemp()
+
+    def tearDown(self):
+        agent.MAPS = self.maps
+
+    def test_other_world_same_start(self):
+        for seed in [7, 14]:
+            first = sim.generate(40, 40, seed)
+            other = splice(first, sim.generate(40, 40, seed + 100))
+            for text in [first, other, other, first]:
+                game = sim.Game(text)
+                sim.play(agent.Agent(), game, 20000)
+                self.assertEqual(game.result, 'won')
+
+class PlannerTest(unittest.TestCase):
+    # each planner finds paths as short as breadth-first search does
+    def states(self, rand):
+        return (rand.randrange(2), rand.random() < 0.5, rand.random() < 0.5, rand.random() < 0.5)
+
+    def test_search_and_jump(self):
+        rand = random.Random(0)
+        for trial in range(40):
+            player = agent.Agent()
+            width = rand.randrange(3, 40)
+            height = rand.randrange(3, 40)
+            random_map(player, rand, width, height, rand.random() * 0.5, rand.random() * 0.2)
+            env = player.env
+            for _ in range(5):
+                state = self.states(rand)
+                table = player.table(*state)
+                start = (rand.randrange(width), rand.randrange(height))
+                target = (rand.randrange(width), rand.randrange(height))
+                if start == target:
+                    continue # pathfind has nothing to say
+                moves = distance(env, start, target, state)
+                check_path(self, env, player.search(target, start, env, table), start, target, state, moves)
+                check_path(self, env, player.jump(target, start, env, table), start, target, state, moves)
+
+    def test_landmarks_follow_changes(self):
+        # the landmark estimates stay low enough for shortest paths as
+        # tiles open up and close off after they've been worked out
+        rand = random.Random(1)
+        player = agent.Agent()
+        random_map(player, rand, 30, 30, 0.15, 0.05)
+        env = player.env
+        for _ in range(20):
+            for _ in range(10):
+                player.set_tile((rand.randrange(30), rand.randrange(30)), rand.choice(' *~'))
+            state = self.states(rand)
+            table = player.table(*state)
+            for _ in range(5):
+                start = (rand.randrange(30), rand.randrange(30))
+                target = (rand.randrange(30), rand.randrange(30))
+                if start == target:
+                    continue # pathfind has nothing to say
+                moves = distance(env, start, target, state)
+                check_path(self, env, player.search(target, start, env, table), start, target, state, moves)
+
+    def test_path_to(self):
+        rand = random.Random(2)
+        player = agent.Agent()
+        random_map(player, rand, 30, 30, 0.3, 0.05)
+        env = player.env
+        for _ in range(10):
+            state = self.states(rand)
+            start = (rand.randrange(30), rand.randrange(30))
+            field = agent.DistanceField(env, start, player.table(*state))
+            for _ in range(10):
+                target = (rand.randrange(30), rand.randrange(30))
+                moves = distance(env, start, target, state)
+                if target == start or agent.passable(env[target], *state):
+                    self.assertEqual(field.get(target), moves)
+                check_path(self, env, field.path_to(target), start, target, state, field.get(target))
+
+    @unittest.skipIf(agent.numpy is None, 'numpy is not installed')
+    def test_numpy_matches_fallback(self):
+        rand = random.Random(3)
+        player = agent.Agent()
+        random_map(player, rand, 40, 30, 0.3, 0.05)
+        env = player.env
+        try:
+            for _ in range(10):
+                table = player.table(*self.states(rand))
+                start = (rand.randrange(40), rand.randrange(30))
+                targets = [(rand.randrange(40), rand.randrange(30)) for _ in range(3)]
+                if start in targets:
+                    continue
+                for every in [False, True]:
+                    agent.numpy = __import__('numpy')
+                    fast = agent.DistanceField(env, start, table, targets, every)
+                    agent.numpy = None
+                    slow = agent.DistanceField(env, start, table, targets, every)
+                    self.assertEqual(fast.radius, slow.radius)
+                    for pos in targets:
+                        self.assertEqual(fast.get(pos), slow.get(pos))
+                agent.numpy = __import__('numpy')
+                fast = agent.DistanceField(env, start, table)
+                agent.numpy = None
+                slow = agent.DistanceField(env, start, table)
+                self.assertEqual(list(fast.dist), list(slow.dist))
+        finally:
+            agent.numpy = __import__('numpy')
+
+    def test_repair_over_ticks(self):
+        # D* Lite keeps its searches between ticks, repairing them as the
+        # agent moves and tiles change around it
+        rand = random.Random(4)
+        for trial in range(5):
+            player = agent.Agent()
+            random_map(player, rand, 30, 30, 0.25, 0.05)
+            env = player.env
+            player.has_axe = rand.random() < 0.5
+            player.has_key = rand.random() < 0.5
+            player.x, player.y = rand.randrange(30), rand.randrange(30)
+            player.set_tile((player.x, player.y), ' ')
+            targets = [(rand.randrange(30), rand.randrange(30)) for _ in range(3)]
+            for tick in range(30):
+                for target in targets:
+                    if target == (player.x, player.y):
+                        continue
+                    for num_stones, optimistic in [(0, False), (1, True)]:
+                        state = (num_stones, optimistic, player.has_axe, player.has_key)
+                        path = player.repair(target, num_stones, optimistic)
+                        moves = distance(env, (player.x, player.y), target, state)
+                        check_path(self, env, path, (player.x, player.y), target, state, moves)
+                        if path and not optimistic:
+                            player.x, player.y = path[1] # only over known tiles
+                for _ in range(5):
+                    pos = (rand.randrange(30), rand.randrange(30))
+                    if pos != (player.x, player.y):
+                        player.set_tile(pos, rand.choice(' *~T'))
+
+    def test_repair_over_a_game(self):
+        # D* Lite keeps its searches between ticks while the map changes
+        # under them; every path it gives should be as short as one found
+        # from scratch
+        test = self
+        class Checked(agent.Agent):
+            def repair(self, target, num_stones = 0, optimistic = True):
+                path = agent.Agent.repair(self, target, num_stones, optimistic)
+                if not self.plan_ahead:
+                    state = (num_stones, optimistic, self.has_axe, self.has_key)
+                    start = (self.x, self.y)
+                    check_path(test, self.env, path, start, target, state, distance(self.env, start, target, state))
+                return path
+        for seed in range(3):
+            game = sim.Game(sim.generate(30, 30, seed, water = 0.1, stones = 3))
+            sim.play(Checked(), game, 20000)
+            self.assertEqual(game.result, 'won')
+
+class ClaimTest(unittest.TestCase):
+    # with another agent sharing the map heading for a frontier tile,
+    # explore leaves the tiles near it alone while there are others
+    def test_claimed_tile_left(self):
+        game = sim.Game(sim.generate(40, 40, 1))
+        shared = agent.SharedMap()
+        try:
+            player = agent.Agent()
+            player.join(shared, game.start, game.direction)
+            other = shared.join()
+            player.explore_gain = True
+            action = ''
+            for _ in range(30):
+                player.update(sim.view_dict(game.view()), action)
+                action = player.get_action()
+                game.step(action)
+            player.update(sim.view_dict(game.view()), action)
+            free = player.explore()[-1]
+            # claims are only ever held by one agent at a time
+            self.assertFalse(shared.claim(other, player.to_world(free)))
+            shared.claim(player.member, None)
+            self.assertTrue(shared.claim(other, player.to_world(free)))
+            x, y = player.explore()[-1]
+            self.assertGreater(abs(x - free[0]) + abs(y - free[1]), agent.SPREAD)
+        finally:
+            shared.close()
+            shared.unlink()
+
+class TeamTest(unittest.TestCase):
+    # agents sharing a map whose tools and stones are split between them
+    # put their stones where the others' tools can use them, and give up
+    # rather than waiting for good when none of them can do anything
+    def test_split_tools(self):
+        text = sim.load_map(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maps', 's5.in'))
+        for count in [2, 3, 4]:
+            for seed in range(4):
+                games = sim.team(text, count, seed)
+                sim.play_team(agent, games, 3000)
+                self.assertIn('won', [game.result for game in games])
+
+    def test_give_up(self):
+        # the gold is cut off by water, and there are no stones
+        games = sim.team('~~~~~~~\n~ ^   ~\n~~~~~~~\n~~~$~~~\n~~~~~~~\n', 2)
+        rounds, _ = sim.play_team(agent, games, 3000)
+        self.assertLess(rounds, 100)
+        self.assertEqual([game.result for game in games], [None, None])
+
+class TourTest(unittest.TestCase):
+    # with the gold in sight behind a tree, the agent goes for the axe and
+    # then the gold, leaving the stone that's nearer but off the way
+    def test_item_off_route_skipped(self):
+        game = sim.Game('*********\n*   o  a*\n*    ^  *\n*****T***\n*    $  *\n*********\n')
+        player = agent.Agent()
+        player.update(sim.view_dict(game.view()), '')
+        self.assertTrue(player.gold)
+        self.assertEqual(len(player.stone), 1)
+        sim.play(player, game, 500)
+        self.assertEqual(game.result, 'won')
+        self.assertEqual(game.num_stones, 0)
+        self.assertEqual(game.rows[1][4], 'o')
+
+class ProfilerTest(unittest.TestCase):
+    # a profiler only wraps the agent it's installed in, and the module's
+    # heap and queue only until the last one is closed
+    def test_closed_profiler_leaves_nothing_behind(self):
+        heap = agent.heapq
+        queue = agent.deque
+        player = agent.Agent()
+        profiler = agent.Profiler(os.devnull)
+        profiler.install(player)
+        game = sim.Game(sim.generate(30, 30, 0))
+        sim.play(player, game, 20000)
+        self.assertGreater(profiler.total_counts['nodes'], 0)
+        self.assertIs(agent.heapq, heap)
+        self.assertIs(agent.deque, queue)
+        self.assertIsNone(player.profiler)
+        self.assertNotIn('get_action', vars(player))
+        self.assertIsNone(getattr(agent.Profiler.local, 'active', None))
+
+    def test_profilers_in_threads(self):
+        heap = agent.heapq
+        queue = agent.deque
+        def play(seed):
+            player = agent.Agent()
+            profiler = agent.Profiler(os.devnull)
+            profiler.install(player)
+            sim.play(player, sim.Game(sim.generate(20, 20, seed)), 2000)
+        threads = [threading.Thread(target = play, args = (seed,)) for seed in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(agent.Profiler.installed, 0)
+        self.assertIs(agent.heapq, heap)
+        self.assertIs(agent.deque, queue)
+
+if __name__ == '__main__':
+    unittest.main()